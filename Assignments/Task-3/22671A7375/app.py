@@ -1,48 +1,243 @@
 
 import io
+import zipfile
+import os
 import cv2
 import time
+import weakref
 import numpy as np
 import streamlit as st
 from typing import Tuple
+from pipeline import run_pipeline
+from warp import remap_cache, rotation_matrix, perspective_matrix
+from pyramid import pyramid_for
+from display import content_key, submit_preview, preview_bytes
+from decodeplan import decode_preview, plan, read_preview
+from probe import probe_bytes
+from canny import canny_engine
+from histogram import hist_service, plot_histograms
+from clahe import clahe, TemporalCLAHE
+from sweep import SWEEPS, axis_values, combinations, proxy, run_sweep
+from history import EditHistory
+from gallery import Gallery, output_names
+from jobs import Cancelled, JobSlot
+from shmpool import shared_pool
+from imghash import BKTree, THUMBS, image_hash
+from dupes import find_groups, hash_files
+from imgindex import walk
+from retrieval import METRICS, DescriptorStore, current_version, open_store
+from metrics import compare as quality_metrics
+from compare import VIEWS, compare_pair
+from sharedcache import CacheRefs, cached_step, decoded, shared_cache
+from sessionmem import memory_manager
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from utils import (
-    get_image_info, bgr_to_rgb, rgb_to_bgr, rgb_to_hsv, hsv_to_rgb, rgb_to_ycrcb, ycrcb_to_rgb,
-    rgb_to_gray, gray_to_rgb, rotate_image, scale_image, translate_image, affine_transform,
-    perspective_transform, bitwise_and, bitwise_or, bitwise_xor, bitwise_not, mean_filter,
-    gaussian_filter, median_filter, sobel_edges, laplacian_edges, canny_edges, morphology,
-    histogram_equalization, contrast_stretch, sharpen, ensure_rgb, ensure_gray, to_3channel,
-    split_screen_compare, encode_format
+    get_image_info, rotate_image, scale_image, translate_image, affine_transform,
+    perspective_transform, bitwise_and, bitwise_or, bitwise_xor, bitwise_not, sobel_edges,
+    laplacian_edges, canny_edges, histogram_equalization, contrast_stretch, sharpen, ensure_gray, to_3channel,
+    encode_format
 )
 
 st.set_page_config(page_title="Image Processing Toolkit", layout="wide")
 st.title("🖼️ Image Processing Toolkit — OpenCV + Streamlit")
 
+VIEW_W, VIEW_H = 960, 720
+ZOOMS = {"Fit": None, "1/8×": 0.125, "1/4×": 0.25, "1/2×": 0.5, "1×": 1.0, "2×": 2.0, "4×": 4.0}
+
+def show_zoomable(img: np.ndarray, key: str, widget_key: str, caption: str = None):
+    """Zoom/pan view that only sends the visible tiles of the right pyramid level.
+
+    `key` identifies the content (the pyramid cache key); `widget_key` prefixes the
+    zoom/pan widgets and must stay the same while the content changes under them.
+    """
+    pyr = pyramid_for(key, img)
+    z = st.select_slider("Zoom", list(ZOOMS), value="Fit", key=f"{widget_key}_zoom")
+    zoom = ZOOMS[z] or pyr.fit_zoom(VIEW_W, VIEW_H)
+    c1, c2 = st.columns(2)
+    px = c1.slider("Pan X (%)", 0, 100, 50, key=f"{widget_key}_px")
+    py = c2.slider("Pan Y (%)", 0, 100, 50, key=f"{widget_key}_py")
+    w, h = pyr.size
+    view = pyr.viewport(px / 100 * w, py / 100 * h, zoom, VIEW_W, VIEW_H)
+    st.image(preview_bytes(view, VIEW_W, codec=preview_codec, quality=preview_quality),
+             use_container_width=True, caption=caption)
+
+def result_key(img: np.ndarray) -> str:
+    """Content key of a processed result; hashed once per array object, since cached results repeat."""
+    if img is orig_rgb:
+        return f"orig:{src_key}"
+    memo = st.session_state.get("result_key")
+    if memo is not None and memo[0]() is img:
+        return memo[1]
+    key = content_key(img)
+    st.session_state["result_key"] = (weakref.ref(img), key)
+    return key
+
+def session_memory():
+    """This session's SessionMemory; its arrays are released when the session's state goes away."""
+    mem = st.session_state.get("memory")
+    if mem is None:
+        ctx = get_script_run_ctx()
+        mem = st.session_state["memory"] = memory_manager().session(ctx.session_id if ctx else None)
+    return mem
+
+pending_job = None
+
+def run_in_background(img: np.ndarray, op: str, params: dict, img_key: str = None) -> np.ndarray:
+    """Run a slow step off the script thread; until it lands, return the last finished result.
+
+    Results go through the cross-session cache, keyed by img_key (the upload by default).
+    """
+    global pending_job
+    img_key = img_key or src_key
+    slot = st.session_state.get("job_slot")
+    if slot is None:
+        # The last finished result is kept in the session's memory; the shared cache owns the
+        # pixels (cached_step), so the session holds them weakly and does not count them twice
+        slot = st.session_state["job_slot"] = JobSlot(memory=session_memory(), borrowed=True)
+    job = slot.submit((src_key, op, repr(sorted(params.items()))), cached_step, img_key, img, op, params)
+    if job.wait(0.3):  # fast ops land within the grace period and never flicker
+        try:
+            res = slot.result(job)
+            if res is not None:
+                return res
+        except Cancelled:
+            pass
+    pending_job = job
+    if slot.last is not None and slot.last[0][0] == src_key:
+        last = slot.last_result()
+        if last is not None:
+            return last
+    return img
+
+def op_controls(container, key_prefix: str) -> Tuple[str, dict]:
+    """Operation picker with one slider per parameter (the sweep specs, defaulting to mid-range)."""
+    label = container.selectbox("Operation", list(SWEEPS), key=f"{key_prefix}_op")
+    op, fixed, specs = SWEEPS[label]
+    params = dict(fixed)
+    for name, spec in specs.items():
+        vmin, vmax, step = spec
+        params[name] = container.slider(name, vmin, vmax, axis_values(spec, vmin, vmax, 3)[1], step,
+                                        key=f"{key_prefix}_{label}_{name}")
+    return op, params
+
 # --- Menu (Top) ---
 with st.sidebar:
     st.header("📁 File")
-    uploaded = st.file_uploader("Open image", type=["png","jpg","jpeg","bmp"])
+    uploads = st.file_uploader("Open image(s)", type=["png","jpg","jpeg","bmp"], accept_multiple_files=True)
     save_format = st.selectbox("Save format", ["png","jpg","bmp"], index=0)
     save_btn = st.button("💾 Save Processed Image")
+    zoom_view = st.toggle("Zoom/Pan viewer (large images)", value=False)
+    show_hist = st.toggle("Show histograms", value=False)
+    with st.expander("Display"):
+        preview_codec = st.selectbox("Preview codec", ["jpeg","webp","png"], index=0)
+        preview_quality = st.slider("Preview quality", 30, 100, 85)
+        preview_w = st.slider("Preview width (px)", 320, 1920, 800, step=80)
     st.markdown("---")
     st.header("⚙️ Operations")
 
+# Gallery: every upload gets a background thumbnail; the selected one is the image being edited
+gallery = st.session_state.get("gallery")
+if gallery is None:
+    gallery = st.session_state["gallery"] = Gallery(memory=session_memory())
+gallery.sync(uploads or [])
+if len(gallery) > 1:
+    with st.expander(f"🖼️ Gallery ({len(gallery)} images)", expanded=True):
+        keys = list(gallery.items)
+        per_page = 24
+        page = st.number_input("Page", 1, -(-len(keys) // per_page), 1) if len(keys) > per_page else 1
+        shown = keys[(page - 1) * per_page:page * per_page]
+        for row in range(0, len(shown), 8):
+            for c, key in zip(st.columns(8), shown[row:row + 8]):
+                thumb = gallery.thumbnail(key, timeout=5)
+                name = gallery.items[key].name
+                if thumb is not None:
+                    c.image(thumb, caption=("▶ " if key == gallery.selected else "") + name, use_container_width=True)
+                else:
+                    c.caption(f"⚠️ {name}")
+                if c.button("Select", key=f"gal_sel_{key}", disabled=key == gallery.selected):
+                    gallery.select(key)
+
+        st.markdown("**Apply to gallery**")
+        hist = st.session_state.get("history")
+        has_history = hist is not None and hist[0] == gallery.selected and bool(hist[1].pipeline())
+        c1, c2 = st.columns(2)
+        source = c1.radio("Steps", ["Operation", "Edit History steps"] if has_history else ["Operation"],
+                          horizontal=True)
+        scope = c2.radio("Apply to", ["Selected image", "All images"], horizontal=True)
+        if source == "Operation":
+            op, params = op_controls(st, "gal")
+            steps = [{"op": op, "params": params}]
+        else:
+            steps = hist[1].pipeline()
+        if st.button("▶ Run"):
+            ext = f".{save_format}"
+            bar = st.progress(0.0, text="Starting…")
+            run_keys = [gallery.selected] if scope == "Selected image" else keys
+            names = output_names([gallery.items[k] for k in run_keys], ext)
+            # Results go straight into the ZIP as they finish: only the archive is kept, built once
+            zbuf, done, errors = io.BytesIO(), 0, []
+            with zipfile.ZipFile(zbuf, "w", zipfile.ZIP_STORED) as zf:  # outputs are already compressed
+                for key, out, err in gallery.apply(run_keys, steps, ext,
+                                                   progress=lambda d, n: bar.progress(d / n, text=f"{d}/{n} images")):
+                    if err is not None:
+                        errors.append(f"{gallery.items[key].name}: {err}")
+                    else:
+                        zf.writestr(names[key], out)
+                        done += 1
+            # The archive is kept in the session's memory, so it counts against the budget and can be spilled
+            st.session_state["gallery_out"] = done
+            if done:
+                session_memory().put("gallery_zip", np.frombuffer(zbuf.getvalue(), np.uint8))
+            else:
+                session_memory().discard("gallery_zip")
+            for e in errors:
+                st.warning(e)
+        archive = session_memory().get("gallery_zip") if st.session_state.get("gallery_out") else None
+        if archive is not None:
+            st.download_button(f"Download {st.session_state['gallery_out']} processed images (.zip)",
+                               data=archive.tobytes(), file_name="processed.zip")
+
 # Load image
 src_bytes = None
+orig = None
 orig_rgb = None
-if uploaded is not None:
-    src_bytes = uploaded.getvalue()
-    file_bytes = np.frombuffer(src_bytes, np.uint8)
-    img_bgr = cv2.imdecode(file_bytes, cv2.IMREAD_UNCHANGED)
-    if img_bgr is not None and len(img_bgr.shape) == 2:
-        img_bgr = cv2.cvtColor(img_bgr, cv2.COLOR_GRAY2BGR)
-    if img_bgr is not None:
-        orig_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+src_key = None
+info = None
+orig_preview = None
+current = gallery.current
+if current is not None:
+    src_bytes = current.data
+    src_key = current.key
+    # For JPEGs the original preview comes from a reduced-resolution decode (1/2-1/8) just covering
+    # the panel, started first so it overlaps the full decode and the operation below. Other formats
+    # have no scaled decode: their preview is made from the full decode once it is there. Keyed by
+    # the upload hash, it is never re-encoded while only the processed side changes
+    if not zoom_view and plan(probe_bytes(src_bytes), preview_w).factor > 1:
+        orig_preview = submit_preview(None, preview_w, key=f"orig:{src_key}", codec=preview_codec,
+                                      quality=preview_quality, load=lambda: decode_preview(src_bytes, preview_w))
+    # Decoded once per upload content, shared by every session that uploads the same file and
+    # kept with its gray/HSV/YCrCb conversions; pinned while this session has it open.
+    # The pixels are read-only: every branch below builds new results, so none needs its own copy
+    refs = st.session_state.get("cache_refs")
+    if refs is None:
+        refs = st.session_state["cache_refs"] = CacheRefs(shared_cache())
+    # On a miss the gallery's recent selections are reused before decoding again
+    orig = decoded(src_bytes, refs, key=src_key, load=lambda: gallery.image(src_key))
+    if orig is not None:
+        gallery.keep(src_key, orig)
+        orig_rgb = orig.rgb
+        if not zoom_view and orig_preview is None:
+            orig_preview = submit_preview(orig_rgb, preview_w, key=f"orig:{src_key}", codec=preview_codec,
+                                          quality=preview_quality)
+        if "info" not in orig.meta:
+            orig.meta["info"] = get_image_info(orig_rgb, src_bytes, current.name.split(".")[-1])
+        info = orig.meta["info"]
 
 # Sidebar options (after load)
 mode = st.sidebar.selectbox(
     "Choose category",
     ["Image Info", "Color Conversions", "Transformations", "Filtering & Morphology",
-     "Enhancement", "Edge Detection", "Compression", "Bitwise Ops", "Video (Bonus)"],
+     "Enhancement", "Edge Detection", "Compression", "Bitwise Ops", "Parameter Sweep", "Edit History", "Duplicates", "Similar Images", "Video (Bonus)"],
     index=0
 )
 
@@ -50,8 +245,10 @@ mode = st.sidebar.selectbox(
 col1, col2 = st.columns(2, vertical_alignment="center")
 with col1:
     st.subheader("Original")
-    if orig_rgb is not None:
-        st.image(orig_rgb, channels="RGB", use_container_width=True, caption="Original Image")
+    if orig_rgb is not None and zoom_view:
+        show_zoomable(orig_rgb, f"orig:{src_key}", "orig", caption="Original Image")
+    elif orig_rgb is not None:
+        st.image(orig_preview.result(), use_container_width=True, caption="Original Image")
     else:
         st.info("Upload an image to begin.")
 
@@ -60,29 +257,28 @@ processed = None
 # --- Operations ---
 if orig_rgb is not None:
     if mode == "Image Info":
-        info = get_image_info(cv2.cvtColor(orig_rgb, cv2.COLOR_RGB2BGR), src_bytes, uploaded.name.split(".")[-1] if uploaded else None)
         st.sidebar.json(info)
-        processed = orig_rgb.copy()
+        processed = orig_rgb
 
     elif mode == "Color Conversions":
         conv = st.sidebar.selectbox("Conversion", ["RGB→HSV","HSV→RGB","RGB→YCbCr","YCbCr→RGB","RGB→Gray","Gray→RGB"])
-        img = orig_rgb.copy()
+        # Conversions are memoized on the image; HSV/YCbCr back to RGB resolve to the source pixels
         if conv == "RGB→HSV":
-            processed = rgb_to_hsv(img)
+            processed = orig.to("HSV")
         elif conv == "HSV→RGB":
-            processed = hsv_to_rgb(rgb_to_hsv(img))
+            processed = orig.as_space("HSV").to("RGB")
         elif conv == "RGB→YCbCr":
-            processed = rgb_to_ycrcb(img)
+            processed = orig.to("YCrCb")
         elif conv == "YCbCr→RGB":
-            processed = ycrcb_to_rgb(rgb_to_ycrcb(img))
+            processed = orig.as_space("YCrCb").to("RGB")
         elif conv == "RGB→Gray":
-            processed = rgb_to_gray(img)
+            processed = orig.gray
         elif conv == "Gray→RGB":
-            processed = gray_to_rgb(rgb_to_gray(img))
+            processed = orig.as_space("GRAY").to("RGB")
 
     elif mode == "Transformations":
-        tmode = st.sidebar.selectbox("Transform", ["Rotation","Scaling","Translation","Affine","Perspective"])
-        img = orig_rgb.copy()
+        tmode = st.sidebar.selectbox("Transform", ["Rotation","Scaling","Translation","Affine","Perspective","Combined"])
+        img = orig_rgb
         h, w = img.shape[:2]
         if tmode == "Rotation":
             ang = st.sidebar.slider("Angle (deg)", -180, 180, 30)
@@ -105,20 +301,31 @@ if orig_rgb is not None:
             src = np.float32([[0,0],[w-1,0],[0,h-1],[w-1,h-1]])
             dst = np.float32([[int(0.1*w),int(0.1*h)],[int(0.9*w),int(0.05*h)],[int(0.05*w),int(0.9*h)],[int(0.95*w),int(0.95*h)]])
             processed = perspective_transform(img, src, dst)
+        elif tmode == "Combined":
+            st.sidebar.info("Rotate → Scale → Translate, resampled once.")
+            ang = st.sidebar.slider("Angle (deg)", -180, 180, 30)
+            fs = st.sidebar.slider("Scale", 10, 300, 100) / 100.0
+            tx = st.sidebar.slider("Shift X", -w//2, w//2, 0)
+            ty = st.sidebar.slider("Shift Y", -h//2, h//2, 0)
+            fit = st.sidebar.checkbox("Fit canvas to result", value=False)
+            steps = [{"op": "rotate_image", "params": {"angle": ang}},
+                     {"op": "scale_image", "params": {"fx": fs, "fy": fs}},
+                     {"op": "translate_image", "params": {"tx": tx, "ty": ty}}]
+            processed = run_pipeline(img, steps, fit=fit)
 
     elif mode == "Filtering & Morphology":
         fmode = st.sidebar.selectbox("Filter", ["Mean","Gaussian","Median","Sobel","Laplacian","Dilation","Erosion","Opening","Closing"])
-        img = orig_rgb.copy()
+        img = orig_rgb
         if fmode in ["Mean","Gaussian","Median"]:
             k = st.sidebar.slider("Kernel size", 3, 31, 5, step=2)
             if fmode == "Mean":
-                processed = mean_filter(img, k)
+                processed = run_in_background(img, "mean_filter", {"k": k})
             elif fmode == "Gaussian":
-                processed = gaussian_filter(img, k, 0)
+                processed = run_in_background(img, "gaussian_filter", {"k": k, "sigma": 0})
             elif fmode == "Median":
-                processed = median_filter(img, k)
+                processed = run_in_background(img, "median_filter", {"k": k})
         elif fmode in ["Sobel","Laplacian"]:
-            gray = ensure_gray(img)
+            gray = orig.gray
             if fmode == "Sobel":
                 processed = sobel_edges(gray)
             else:
@@ -126,51 +333,69 @@ if orig_rgb is not None:
         else:
             k = st.sidebar.slider("Kernel size", 3, 31, 5, step=2)
             it = st.sidebar.slider("Iterations", 1, 5, 1)
-            gray_or_rgb = ensure_gray(img)
+            shape = st.sidebar.selectbox("Element", ["Rect","Ellipse","Cross"]).lower()
+            gray_or_rgb = orig.gray
             op = {"Dilation":"dilate","Erosion":"erode","Opening":"open","Closing":"close"}[fmode]
-            morphed = morphology(gray_or_rgb, op, k, it)
-            processed = morphed
+            processed = run_in_background(gray_or_rgb, "morphology", {"op": op, "k": k, "iterations": it, "shape": shape},
+                                          img_key=orig.as_space("GRAY").key)
 
     elif mode == "Enhancement":
-        emode = st.sidebar.selectbox("Enhance", ["Histogram Equalization","Contrast Stretching","Sharpening"])
-        img = orig_rgb.copy()
+        emode = st.sidebar.selectbox("Enhance", ["Histogram Equalization","CLAHE","Contrast Stretching","Sharpening"])
+        img = orig_rgb
         if emode == "Histogram Equalization":
-            processed = histogram_equalization(img)
+            processed = histogram_equalization(img, hist_service.luma(orig_rgb, key=src_key))
+        elif emode == "CLAHE":
+            clip = st.sidebar.slider("Clip limit", 0.5, 10.0, 2.0, 0.5)
+            grid = st.sidebar.slider("Tile grid", 2, 32, 8)
+            space = st.sidebar.selectbox("Channel", ["L (Lab)","Y (YCrCb)"])
+            processed = clahe(img, clip, (grid, grid), "lab" if space.startswith("L") else "ycrcb")
         elif emode == "Contrast Stretching":
             lo = st.sidebar.slider("Low percentile", 0, 10, 2)
             hi = st.sidebar.slider("High percentile", 90, 100, 98)
-            processed = contrast_stretch(img, lo, hi)
+            processed = contrast_stretch(img, lo, hi, hist_service.get(orig_rgb, key=src_key))
         elif emode == "Sharpening":
             amt = st.sidebar.slider("Amount", 0.0, 3.0, 1.0, 0.1)
             processed = sharpen(img, amt)
 
     elif mode == "Edge Detection":
         emode = st.sidebar.selectbox("Edge", ["Sobel","Canny","Laplacian"])
-        gray = ensure_gray(orig_rgb)
         if emode == "Sobel":
-            processed = sobel_edges(gray)
+            processed = sobel_edges(orig.gray)
         elif emode == "Canny":
-            t1 = st.sidebar.slider("Threshold1", 0, 255, 100)
-            t2 = st.sidebar.slider("Threshold2", 0, 255, 200)
-            processed = canny_edges(gray, t1, t2)
+            # Gray and gradients are cached per upload, so slider moves only rerun hysteresis
+            if st.sidebar.checkbox("Auto thresholds (median)", value=False):
+                sigma = st.sidebar.slider("Sigma", 0.05, 1.0, 0.33, 0.01)
+                t1, t2 = canny_engine.auto_thresholds(orig_rgb, key=src_key, sigma=sigma)
+                st.sidebar.caption(f"Threshold1={t1}, Threshold2={t2}")
+            else:
+                t1 = st.sidebar.slider("Threshold1", 0, 255, 100)
+                t2 = st.sidebar.slider("Threshold2", 0, 255, 200)
+            processed = canny_engine.edges(orig_rgb, t1, t2, key=src_key)
         else:
-            processed = laplacian_edges(gray)
+            processed = laplacian_edges(orig.gray)
 
     elif mode == "Compression":
         fmt = st.sidebar.selectbox("Target format", ["png","jpg","bmp"])
         quality = st.sidebar.slider("JPEG Quality (if JPG)", 10, 100, 90)
-        processed = orig_rgb.copy()
+        processed = orig_rgb
         # Show estimated file sizes
         buf_png = encode_format(processed, ".png")
         buf_jpg = cv2.imencode(".jpg", cv2.cvtColor(processed, cv2.COLOR_RGB2BGR), [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1].tobytes()
         buf_bmp = encode_format(processed, ".bmp")
-        st.sidebar.write({"png_kb": round(len(buf_png)/1024,2),
-                          "jpg_kb": round(len(buf_jpg)/1024,2),
-                          "bmp_kb": round(len(buf_bmp)/1024,2)})
+        # PNG and BMP are lossless, so only the JPEG round trip needs measuring
+        jpg_rgb = cv2.cvtColor(cv2.imdecode(np.frombuffer(buf_jpg, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        q = quality_metrics(orig_rgb, jpg_rgb, ("psnr", "ssim", "ms_ssim"), downsample="auto")
+        lossless = {"psnr_db": "∞", "ssim": 1.0, "ms_ssim": 1.0}
+        st.sidebar.table([
+            {"format": "png", "kb": round(len(buf_png)/1024,2), **lossless},
+            {"format": "jpg", "kb": round(len(buf_jpg)/1024,2), "psnr_db": f"{q['psnr']:.2f}",
+             "ssim": round(q["ssim"], 4), "ms_ssim": round(q["ms_ssim"], 4)},
+            {"format": "bmp", "kb": round(len(buf_bmp)/1024,2), **lossless},
+        ])
 
     elif mode == "Bitwise Ops":
         bmode = st.sidebar.selectbox("Bitwise", ["AND","OR","XOR","NOT"])
-        img = orig_rgb.copy()
+        img = orig_rgb
         # Create a mask shape for demo
         h, w = img.shape[:2]
         mask = np.zeros((h, w, 3), dtype=np.uint8)
@@ -184,43 +409,228 @@ if orig_rgb is not None:
         else:
             processed = bitwise_not(img)
 
+    elif mode == "Parameter Sweep":
+        label = st.sidebar.selectbox("Operation", list(SWEEPS))
+        op, fixed, specs = SWEEPS[label]
+        names = list(specs)
+        axes = {}
+        for name in names[:2]:
+            if name != names[0] and not st.sidebar.checkbox(f"Also sweep {name}", value=False):
+                continue
+            vmin, vmax, step = specs[name]
+            lo, hi = st.sidebar.slider(f"{name} range", vmin, vmax, (vmin, vmax), step)
+            n = st.sidebar.slider(f"{name} steps", 2, 8, 4)
+            axes[name] = axis_values(specs[name], lo, hi, n)
+        sweep_key = (src_key, label, repr(axes))
+        if st.sidebar.button("▶ Run sweep"):
+            old = st.session_state.get("sweep")
+            for i in old["thumbs"] if old else ():
+                session_memory().discard(f"sweep:{i}")
+            st.session_state["sweep"] = {"key": sweep_key, "thumbs": {}}
+        state = st.session_state.get("sweep")
+        if state is not None and state["key"] == sweep_key:
+            combos = combinations(axes)
+            ncols = len(axes[names[0]])
+            with st.expander(f"Contact sheet — {label}", expanded=True):
+                cells = []
+                for r in range(0, len(combos), ncols):
+                    cells.extend(c.container() for c in st.columns(ncols))
+
+            def show_cell(i, params, thumb):
+                with cells[i]:
+                    st.image(thumb, caption=", ".join(f"{k}={v}" for k, v in params.items()), use_container_width=True)
+                    if st.button("Use", key=f"sweep_use_{i}"):
+                        st.session_state["sweep_pick"] = (label, {**fixed, **params})
+
+            # Encoded thumbnails are kept in the session's memory; the state only records their params
+            for i, params in sorted(state["thumbs"].items()):
+                thumb = session_memory().get(f"sweep:{i}")
+                if thumb is not None:
+                    show_cell(i, params, thumb.tobytes())
+            if len(state["thumbs"]) < len(combos):
+                # Thumbnails stream into the grid as the pool finishes them; a rerun that
+                # interrupted the sweep resumes with only the cells still missing
+                for i, params, res in run_sweep(proxy(orig_rgb), op, fixed, axes, skip=set(state["thumbs"])):
+                    thumb = preview_bytes(res, 320, codec=preview_codec, quality=preview_quality)
+                    session_memory().put(f"sweep:{i}", np.frombuffer(thumb, np.uint8))
+                    state["thumbs"][i] = params
+                    show_cell(i, params, thumb)
+        pick = st.session_state.get("sweep_pick")
+        if pick is not None and pick[0] == label:
+            st.sidebar.success(f"Loaded: {pick[1]}")
+            processed = cached_step(src_key, orig_rgb, op, pick[1])
+        else:
+            processed = orig_rgb
+
+    elif mode == "Edit History":
+        # Steps are recorded as (op, params); undo/redo replays from the nearest kept checkpoint
+        entry = st.session_state.get("history")
+        if entry is None or entry[0] != src_key:
+            if entry is not None:
+                entry[1].close()
+            entry = st.session_state["history"] = (src_key, EditHistory(orig_rgb, memory=session_memory()))
+        history = entry[1]
+        op, params = op_controls(st.sidebar, "hist")
+        b1, b2, b3 = st.sidebar.columns(3)
+        if b1.button("Apply"):
+            history.push(op, params)
+        if b2.button("↶ Undo", disabled=not history.can_undo):
+            history.undo()
+        if b3.button("↷ Redo", disabled=not history.can_redo):
+            history.redo()
+        for i, rec in enumerate(history.steps, 1):
+            text = f"{i}. {rec['op']} " + ", ".join(f"{k}={v}" for k, v in rec["params"].items())
+            st.sidebar.caption(f"**{text}**" if i == history.cursor else (text if i < history.cursor else f"~~{text}~~"))
+        processed = history.image()
+        hs = history.stats()
+        st.sidebar.caption(f"{len(hs['checkpoints'])} checkpoints, {hs['checkpoint_bytes'] / 2**20:.0f} / "
+                           f"{hs['budget_bytes'] / 2**20:.0f} MB; {hs['replayed_steps']} steps replayed")
+
+    elif mode == "Duplicates":
+        folder = st.sidebar.text_input("Folder to search", value="")
+        kind = st.sidebar.selectbox("Hash", list(THUMBS), index=1)
+        radius = st.sidebar.slider("Max Hamming distance", 0, 20, 6)
+        scan_key = (folder, kind)
+        if folder and st.sidebar.button("Scan folder"):
+            with st.spinner("Hashing images…"):
+                paths, hashes = hash_files([p for p, _, _ in walk(folder)], kind)
+            tree = BKTree()
+            for i, h in enumerate(hashes):
+                tree.add(int(h), i)
+            st.session_state["dupes"] = {"key": scan_key, "paths": paths, "hashes": hashes, "tree": tree}
+        scan = st.session_state.get("dupes")
+        if scan is not None and scan["key"] == scan_key:
+            def thumb(path):
+                return read_preview(path, 320)
+
+            matches = scan["tree"].query(image_hash(orig.gray, kind), radius)
+            with st.expander(f"Near duplicates of the uploaded image ({len(matches)})", expanded=True):
+                for row in range(0, min(len(matches), 12), 4):
+                    for c, (d, i) in zip(st.columns(4), matches[row:row + 4]):
+                        c.image(thumb(scan["paths"][i]), caption=f"d={d} · {scan['paths'][i]}", use_container_width=True)
+            groups = find_groups(scan["paths"], scan["hashes"], radius)
+            with st.expander(f"Duplicate groups in folder ({len(groups)} of {len(scan['paths'])} images)"):
+                for g in groups[:20]:
+                    for row in range(0, min(len(g), 8), 4):
+                        for c, (path, d) in zip(st.columns(4), g[row:row + 4]):
+                            c.image(thumb(path), caption=f"d={d} · {path}", use_container_width=True)
+                    st.markdown("---")
+        processed = orig_rgb
+
+    elif mode == "Similar Images":
+        store_dir = st.sidebar.text_input("Descriptor store", value="descriptors")
+        build_from = st.sidebar.text_input("Build from folder", value="")
+        if build_from and st.sidebar.button("Build store"):
+            with st.spinner("Describing images…"):
+                DescriptorStore.build(store_dir, [p for p, _, _ in walk(os.path.abspath(build_from))])
+        metric = st.sidebar.selectbox("Distance", list(METRICS))
+        k = st.sidebar.slider("Results", 1, 24, 8)
+        if current_version(store_dir) is not None:
+            store = open_store(store_dir)
+            t0 = time.perf_counter()
+            hits = store.query(orig_rgb, k, metric)
+            with st.expander(f"Similar images — {len(store)} searched in {(time.perf_counter() - t0) * 1000:.0f} ms",
+                             expanded=True):
+                for row in range(0, len(hits), 4):
+                    for c, (path, d) in zip(st.columns(4), hits[row:row + 4]):
+                        img = read_preview(path, 320)
+                        if img is not None:
+                            c.image(img, caption=f"{d:.3f} · {path}", use_container_width=True)
+        else:
+            st.sidebar.info("Build a descriptor store from a folder first.")
+        processed = orig_rgb
+
     elif mode == "Video (Bonus)":
         st.sidebar.info("Enable webcam to apply effects in real-time.")
         enable = st.sidebar.checkbox("Start Webcam")
-        effect = st.sidebar.selectbox("Effect", ["Canny","Sobel","None"])
+        effect = st.sidebar.selectbox("Effect", ["Canny","Sobel","Rotate","Perspective","CLAHE","None"])
+        if effect == "Rotate":
+            v_ang = st.sidebar.slider("Angle (deg)", -180, 180, 30)
+        elif effect == "CLAHE":
+            v_clip = st.sidebar.slider("Clip limit", 0.5, 10.0, 2.0, 0.5)
+            v_grid = st.sidebar.slider("Tile grid", 2, 32, 8)
+            v_alpha = st.sidebar.slider("Temporal smoothing (new-frame weight)", 0.05, 1.0, 0.3, 0.05)
+        # Stateless effects can run in a worker process; frames go through shared memory, not pickling
+        use_pool = effect in ("Canny", "Sobel", "Rotate", "Perspective") and \
+            st.sidebar.checkbox("Process in worker process (shared memory)", value=False)
         if enable:
             frame = st.camera_input("Capture frame")
             if frame:
                 file_bytes = np.asarray(bytearray(frame.getvalue()), dtype=np.uint8)
                 img_bgr = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
                 frame_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-                if effect == "Canny":
+                fh, fw = frame_rgb.shape[:2]
+                src = np.float32([[0,0],[fw-1,0],[0,fh-1],[fw-1,fh-1]])
+                dst = np.float32([[int(0.1*fw),int(0.1*fh)],[int(0.9*fw),int(0.05*fh)],[int(0.05*fw),int(0.9*fh)],[int(0.95*fw),int(0.95*fh)]])
+                if use_pool:
+                    if effect == "Canny":
+                        step = {"op": "canny_edges", "params": {"t1": 100, "t2": 200}}
+                    elif effect == "Sobel":
+                        step = {"op": "sobel_edges", "params": {}}
+                    elif effect == "Rotate":
+                        step = {"op": "rotate_image", "params": {"angle": v_ang}}
+                    else:
+                        step = {"op": "perspective_transform", "params": {"src_pts": src.tolist(), "dst_pts": dst.tolist()}}
+                    processed = shared_pool().process(frame_rgb, [step])
+                elif effect == "Canny":
                     gray = ensure_gray(frame_rgb)
                     processed = canny_edges(gray, 100, 200)
                 elif effect == "Sobel":
                     gray = ensure_gray(frame_rgb)
                     processed = sobel_edges(gray)
+                elif effect in ("Rotate", "Perspective"):
+                    # Same transform every frame: reuse the cached remap tables
+                    if effect == "Rotate":
+                        M = rotation_matrix(v_ang, (fw//2, fh//2))
+                    else:
+                        M = perspective_matrix(src, dst)
+                    processed = remap_cache.warp(frame_rgb, M)
+                elif effect == "CLAHE":
+                    # Tile histograms are smoothed across frames to stop flicker
+                    tc = st.session_state.get("video_clahe")
+                    if tc is None:
+                        tc = st.session_state["video_clahe"] = TemporalCLAHE(memory=session_memory())
+                    tc.clip, tc.grid, tc.alpha = v_clip, (v_grid, v_grid), v_alpha
+                    processed = tc.apply(frame_rgb)
                 else:
-                    processed = frame_rgb.copy()
+                    processed = frame_rgb
         else:
-            processed = orig_rgb.copy()
+            processed = orig_rgb
 
 # Right panel display
 with col2:
     st.subheader("Processed")
     if orig_rgb is not None and processed is not None:
-        st.image(processed, use_container_width=True, clamp=True)
-        compare = st.toggle("Split Screen Compare (Half/Half)", value=False)
+        job_status = st.empty()
+        if zoom_view:
+            # Widgets keep a fixed key so zoom/pan survive reruns; the pyramid is cached by content
+            show_zoomable(processed, result_key(processed), "processed")
+        else:
+            st.image(preview_bytes(processed, preview_w, codec=preview_codec, quality=preview_quality),
+                     use_container_width=True)
+        compare = st.toggle("Compare with original", value=False)
         if compare:
-            left = orig_rgb.copy()
-            right = to_3channel(processed)
-            if left.shape != right.shape:
-                h = min(left.shape[0], right.shape[0])
-                w = min(left.shape[1], right.shape[1])
-                left = left[:h,:w]
-                right = right[:h,:w]
-            split = split_screen_compare(left, right)
-            st.image(split, use_container_width=True, caption="Split Screen Comparison")
+            # Aligned sides and difference buffers are cached per (original, result, width), both
+            # keyed by content, so the sliders below only slice or look up into them
+            pair = compare_pair(orig_rgb, processed, preview_w, left_key=f"orig:{src_key}",
+                                right_key=result_key(processed))
+            view = st.radio("View", VIEWS, horizontal=True)
+            pos, gain, thresh = 0.5, 1.0, 25
+            if view == "Wipe":
+                pos = st.slider("Divider (%)", 0, 100, 50) / 100
+            elif view in ("Absolute difference", "Signed difference"):
+                gain = st.slider("Gain", 1.0, 16.0, 4.0, 0.5)
+            else:
+                thresh = st.slider("Change threshold", 0, 255, 25)
+            q = pair.quality()
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("PSNR (luma)", "∞" if q["psnr"] == float("inf") else f"{q['psnr']:.2f} dB")
+            m2.metric("SSIM", f"{q['ssim']:.4f}")
+            m3.metric("MS-SSIM", f"{q['ms_ssim']:.4f}")
+            m4.metric("Changed", f"{100 * pair.changed_fraction(thresh):.1f}%")
+            st.image(preview_bytes(pair.view(view, pos, gain, thresh), preview_w, codec=preview_codec,
+                                   quality=preview_quality),
+                     use_container_width=True, caption=view)
     elif orig_rgb is not None:
         st.info("Select an operation from the left panel.")
 
@@ -228,14 +638,40 @@ with col2:
 st.markdown("---")
 st.subheader("📊 Status")
 if orig_rgb is not None:
-    info = get_image_info(cv2.cvtColor(orig_rgb, cv2.COLOR_RGB2BGR), src_bytes, uploaded.name.split(".")[-1] if uploaded else None)
     st.write(f"Dimensions (H,W,C): {info['dimensions']} | File format: {info['file_format']} | File size: {info['file_size_kb']} KB | DPI/PPI: {info['dpi_ppi']}")
+    mem = memory_manager().stats()
+    st.caption(f"Server memory: {mem['resident_bytes'] / 2**20:.0f} / {mem['limit_bytes'] / 2**20:.0f} MB resident "
+               f"across {mem['sessions']} sessions, {mem['spilled_bytes'] / 2**20:.0f} MB spilled to disk "
+               f"(this session: {session_memory().nbytes / 2**20:.0f} MB)")
+    sc = shared_cache().stats()
+    st.caption(f"Shared cache: {sc['entries']} entries, {sc['bytes'] / 2**20:.0f} / {sc['max_bytes'] / 2**20:.0f} MB "
+               f"({sc['pinned_bytes'] / 2**20:.0f} MB in use), {sc['hits']} hits, {sc['waits']} joined in-flight")
 else:
     st.write("No image loaded.")
 
+if orig_rgb is not None and show_hist:
+    # Plots are drawn from the 256-value tables, on a ~1 MP subsample
+    hc1, hc2 = st.columns(2)
+    stride = hist_service.preview_stride(orig_rgb)
+    with hc1:
+        st.pyplot(plot_histograms(hist_service.get(orig_rgb, key=src_key, stride=stride), ["R","G","B"], "Original"))
+    if processed is not None:
+        labels = ["R","G","B"] if processed.ndim == 3 else ["Gray"]
+        with hc2:
+            st.pyplot(plot_histograms(hist_service.get(processed, stride=hist_service.preview_stride(processed)), labels, "Processed"))
+
 # Save processed
 if orig_rgb is not None and 'processed' in locals() and processed is not None and save_btn:
     ext = f".{save_format}"
     buf = encode_format(to_3channel(processed), ext if ext != ".jpg" else ".jpg")
     if buf:
         st.download_button("Download processed image", data=buf, file_name=f"processed{ext}")
+
+# Background job still running: keep showing the last result, then rerun once it lands.
+# Updating the status element lets Streamlit interrupt this wait when a widget changes.
+if pending_job is not None:
+    t0 = time.time()
+    while not pending_job.done():
+        job_status.caption(f"⏳ computing… {time.time() - t0:.1f}s (showing last result)")
+        time.sleep(0.2)
+    st.rerun()
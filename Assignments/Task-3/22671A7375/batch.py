@@ -0,0 +1,219 @@
+"""Batch-process a directory of images through a pipeline on a shared-memory worker pool.
+
+    python batch.py photos/ out/ --pipeline steps.json --workers 4 --format png
+    python batch.py photos/ out/ --step gaussian_filter k=9 --step sharpen amount=1.5
+    python batch.py photos/ out/ --pipeline steps.json --intermediates   # also resume from stored prefixes
+
+A pipeline file holds a JSON list of steps: [{"op": "gaussian_filter", "params": {"k": 9}}, ...].
+
+Results are kept in a content-addressed store (out/.store by default, see
+resultstore.py): re-running skips inputs whose bytes and pipeline are
+unchanged, and with --intermediates an edited later step resumes from the
+stored output of the unchanged steps before it.
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+import cv2
+import numpy as np
+from pipeline import OPS
+from resultstore import ResultStore, boundaries
+from shmpool import SharedMemoryPool
+
+EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+
+
+def list_images(root: str) -> List[str]:
+    paths = []
+    for dirpath, _, files in os.walk(root):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in EXTS:
+                paths.append(os.path.join(dirpath, name))
+    return sorted(paths)
+
+
+def parse_steps(args) -> List[Dict[str, Any]]:
+    if args.pipeline:
+        with open(args.pipeline) as f:
+            steps = json.load(f)
+    else:
+        steps = []
+        for op, *kvs in args.step:
+            params = {}
+            for kv in kvs:
+                k, v = kv.split("=", 1)
+                try:
+                    params[k] = json.loads(v)
+                except ValueError:
+                    params[k] = v
+            steps.append({"op": op, "params": params})
+    for s in steps:
+        if s["op"] not in OPS:
+            raise SystemExit(f"Unknown operation: {s['op']}")
+    return steps
+
+
+def decode_into(pool: SharedMemoryPool, data: bytes):
+    """Decode straight into a pooled segment (the BGR->RGB swap writes there)."""
+    bgr = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if bgr is None:
+        return None, None
+    shm, arr = pool.frame(bgr.shape, np.uint8)
+    cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=arr)
+    return shm, arr
+
+
+def encode_result(img: np.ndarray, fmt: str) -> bytes:
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    ok, buf = cv2.imencode(f".{fmt}", img)
+    if not ok:
+        raise ValueError(f"Could not encode as {fmt}")
+    return buf.tobytes()
+
+
+def write_result(path: str, img: np.ndarray, fmt: str):
+    """Encode img to path through a temporary file, so an existing output is replaced, never truncated."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = encode_result(img, fmt)
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class Task:
+    """One input on its way through the pipeline; `stop` is the prefix length the running segment ends at."""
+
+    def __init__(self, src: str, dest: str, in_key: Optional[str], final: Optional[str], stop: int):
+        self.src = src
+        self.dest = dest
+        self.in_key = in_key
+        self.final = final
+        self.stop = stop
+        self.fut = None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Apply a pipeline to every image under a directory")
+    ap.add_argument("input")
+    ap.add_argument("output")
+    ap.add_argument("--pipeline", help="JSON file with a list of steps")
+    ap.add_argument("--step", nargs="+", action="append", default=[], metavar=("OP", "K=V"),
+                    help="op name followed by name=value params, repeatable")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--format", default="png")
+    ap.add_argument("--inflight", type=int, default=None, help="frames in shared memory at once (default 2 x workers)")
+    ap.add_argument("--store", default=None, help="result store directory (default OUTPUT/.store)")
+    ap.add_argument("--no-store", action="store_true", help="always recompute and do not record results")
+    ap.add_argument("--intermediates", action="store_true",
+                    help="also store the image at each step boundary so an edited step resumes from there")
+    ap.add_argument("--store-max-mb", type=int, default=4096, help="trim the store to this size after the run")
+    args = ap.parse_args()
+
+    steps = parse_steps(args)
+    paths = list_images(args.input)
+    workers = args.workers or os.cpu_count() or 1
+    inflight = args.inflight or 2 * workers
+    store = None if args.no_store else ResultStore(args.store or os.path.join(args.output, ".store"))
+    cuts = boundaries(steps) if store is not None and args.intermediates else []
+    t0 = time.perf_counter()
+    done = failed = reused = resumed = 0
+
+    def next_stop(start: int) -> int:
+        return next((c for c in cuts if c > start), len(steps))
+
+    with SharedMemoryPool(workers) as pool:
+        pending = deque()
+
+        def drain_one():
+            nonlocal done, failed
+            task = pending.popleft()
+            try:
+                with task.fut.result() as lease:
+                    if task.stop < len(steps):
+                        # Record this prefix, then queue the next segment on a copy of the frame
+                        store.put_array(store.prefix_key(task.in_key, steps[:task.stop]), lease.array)
+                        start, task.stop = task.stop, next_stop(task.stop)
+                        task.fut = pool.submit(lease.array, steps[start:task.stop])
+                        pending.append(task)
+                        return
+                    if store is None:
+                        write_result(task.dest, lease.array, args.format)
+                    else:
+                        store.put(task.final, encode_result(lease.array, args.format))
+                        store.export(task.final, task.dest)
+                done += 1
+            except Exception as exc:
+                failed += 1
+                print(f"FAILED {task.src}: {exc}")
+
+        for path in paths:
+            rel = os.path.splitext(os.path.relpath(path, args.input))[0] + "." + args.format
+            dest = os.path.join(args.output, rel)
+            try:
+                if store is None:
+                    in_key = final = None
+                    with open(path, "rb") as f:
+                        data = f.read()
+                else:
+                    in_key, data = store.input_key(path)
+                    final = store.result_key(in_key, steps, args.format)
+                    if store.has(final):
+                        store.export(final, dest)
+                        reused += 1
+                        continue
+            except OSError as exc:
+                failed += 1
+                print(f"FAILED {path}: {exc}")
+                continue
+            start, prefix = 0, None
+            for cut in reversed(cuts):
+                prefix = store.get_array(store.prefix_key(in_key, steps[:cut]))
+                if prefix is not None:
+                    start = cut
+                    break
+            if prefix is not None:
+                shm, arr = pool.frame(prefix.shape, prefix.dtype)
+                arr[...] = prefix
+                resumed += 1
+            else:
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                shm, arr = decode_into(pool, data)
+                if shm is None:
+                    failed += 1
+                    print(f"FAILED {path}: could not decode")
+                    continue
+            task = Task(path, dest, in_key, final, next_stop(start))
+            task.fut = pool.submit_frame(shm, arr, steps[start:task.stop])
+            pending.append(task)
+            del arr, prefix, data
+            # Bounded window: decoding runs ahead of the workers by at most `inflight` frames
+            while len(pending) >= inflight:
+                drain_one()
+        while pending:
+            drain_one()
+
+    wall = time.perf_counter() - t0
+    print(f"{done} images computed ({resumed} resumed from a stored prefix), {reused} reused from the store, "
+          f"{failed} failed, {wall:.2f} s ({done / max(wall, 1e-9):.2f} img/s)")
+    if store is not None:
+        files, freed = store.gc(args.store_max_mb << 20)  # also persists the input stat cache
+        if files:
+            print(f"store trimmed: {files} objects, {freed / 2**20:.1f} MB freed")
+
+
+if __name__ == "__main__":
+    main()
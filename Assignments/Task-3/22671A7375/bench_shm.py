@@ -0,0 +1,67 @@
+"""Compare pickling ProcessPoolExecutor tasks against the shared-memory pool.
+
+    python bench_shm.py --mp 24 --frames 16 --workers 4
+
+Runs the same cheap pipeline on identical frames both ways, so the difference
+is the cost of moving pixels between processes.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from pipeline import run_pipeline
+from shmpool import SharedMemoryPool
+
+STEPS = [{"op": "bitwise_not", "params": {}}]
+
+
+def _pickled(img: np.ndarray, steps):
+    return run_pipeline(img, steps)
+
+
+def bench_pickle(frames, steps, workers: int) -> float:
+    with ProcessPoolExecutor(workers) as ex:
+        list(ex.map(_pickled, frames[:workers], [steps] * workers))  # warm up workers
+        t0 = time.perf_counter()
+        for res in ex.map(_pickled, frames, [steps] * len(frames)):
+            res.sum(dtype=np.uint64)  # touch the result like a consumer would
+        return time.perf_counter() - t0
+
+
+def bench_shm(frames, steps, workers: int) -> float:
+    with SharedMemoryPool(workers) as pool:
+        futs = [pool.submit(f, steps) for f in frames[:workers]]
+        for f in futs:
+            f.result().release()
+        t0 = time.perf_counter()
+        futs = [pool.submit(f, steps) for f in frames]
+        for f in futs:
+            with f.result() as lease:
+                lease.array.sum(dtype=np.uint64)
+        return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pickling vs shared-memory frame transfer")
+    ap.add_argument("--mp", type=float, default=24.0, help="megapixels per RGB frame")
+    ap.add_argument("--frames", type=int, default=16)
+    ap.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = ap.parse_args()
+
+    side = int((args.mp * 1e6) ** 0.5)
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, (side, side, 3), dtype=np.uint8)
+    frames = [base] * args.frames
+    mb = base.nbytes / 1e6
+    print(f"{args.frames} frames of {side}x{side}x3 ({mb:.0f} MB), {args.workers} workers, steps={STEPS}")
+
+    t_pickle = bench_pickle(frames, STEPS, args.workers)
+    t_shm = bench_shm(frames, STEPS, args.workers)
+    for name, t in (("pickle", t_pickle), ("shared memory", t_shm)):
+        print(f"{name:>14}: {t:.2f} s  {args.frames / t:.2f} frames/s  {args.frames * mb / t:.0f} MB/s")
+    print(f"speed-up: {t_pickle / t_shm:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
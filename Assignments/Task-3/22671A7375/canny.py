@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+from collections import OrderedDict
+from typing import Optional, Tuple
+from histogram import hist_service, median
+
+# ------------------------------
+# Gradient-cached Canny
+# ------------------------------
+# cv2.Canny(img, t1, t2) converts, runs two 3x3 Sobels and then the
+# non-maximum suppression/hysteresis. Only the last stage depends on the
+# thresholds, so the gray image and the int16 gradients are kept per image and
+# threshold changes go straight to cv2.Canny(dx, dy, t1, t2). The gray
+# histogram behind the auto thresholds comes from the shared histogram service.
+
+class CannyEngine:
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def _entry(self, img: np.ndarray, key: Optional[str]) -> dict:
+        if key is not None and key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        # cv2.Canny pads with BORDER_REPLICATE, so the Sobels must too to give identical edges
+        entry = {
+            "gray": gray,
+            "dx": cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=3, borderType=cv2.BORDER_REPLICATE),
+            "dy": cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=3, borderType=cv2.BORDER_REPLICATE),
+        }
+        if key is not None:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def edges(self, img: np.ndarray, t1: float, t2: float, key: Optional[str] = None,
+              l2_gradient: bool = False) -> np.ndarray:
+        """Canny edges of an RGB or gray image; pass a content `key` to reuse its gradients."""
+        e = self._entry(img, key)
+        return cv2.Canny(e["dx"], e["dy"], t1, t2, L2gradient=l2_gradient)
+
+    def auto_thresholds(self, img: np.ndarray, key: Optional[str] = None, sigma: float = 0.33) -> Tuple[int, int]:
+        """(t1, t2) = ((1 - sigma) * median, (1 + sigma) * median) of the gray levels."""
+        e = self._entry(img, key)
+        m = median(hist_service.get(e["gray"], None if key is None else f"{key}:gray")[0])
+        return int(max(0, (1.0 - sigma) * m)), int(min(255, (1.0 + sigma) * m))
+
+    def auto_edges(self, img: np.ndarray, key: Optional[str] = None, sigma: float = 0.33,
+                   l2_gradient: bool = False) -> np.ndarray:
+        t1, t2 = self.auto_thresholds(img, key, sigma)
+        return self.edges(img, t1, t2, key, l2_gradient)
+
+
+canny_engine = CannyEngine()
@@ -0,0 +1,201 @@
+import os
+import threading
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+# ------------------------------
+# CLAHE engine
+# ------------------------------
+# A CLAHE pixel only depends on the LUTs of the two tile rows whose centres
+# bracket it, and a tile's LUT only on the tile's own pixels. Running
+# cv2.CLAHE on a band of whole tile rows plus one halo tile row on each side
+# therefore gives the full-image result for the band's own rows (up to a
+# 1-level float rounding of the row coordinate), so big images can be split
+# into bands on a thread pool (cv2 releases the GIL). When OpenCV runs its own
+# thread pool it already parallelises CLAHE internally, and banding on top only
+# adds the halo work, so bands are used by default only when it does not.
+
+PARALLEL_MIN_PIXELS = 4_000_000
+_workers = max(1, min(8, os.cpu_count() or 1))
+_executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix="clahe")
+
+# cv2.CLAHE objects keep scratch buffers, so each one is used by one thread at a time
+_pool: Dict[Tuple[float, Tuple[int, int]], List[cv2.CLAHE]] = {}
+_pool_lock = threading.Lock()
+
+
+@contextmanager
+def clahe_object(clip: float, grid: Tuple[int, int]):
+    key = (float(clip), (int(grid[0]), int(grid[1])))
+    with _pool_lock:
+        free = _pool.setdefault(key, [])
+        obj = free.pop() if free else None
+    if obj is None:
+        obj = cv2.createCLAHE(clipLimit=key[0], tileGridSize=key[1])
+    try:
+        yield obj
+    finally:
+        with _pool_lock:
+            _pool[key].append(obj)
+
+
+def _pad_to_grid(ch: np.ndarray, grid: Tuple[int, int]) -> np.ndarray:
+    # Same extension cv2.CLAHE applies internally when the grid does not divide
+    # the image (note it adds a whole extra tile on an axis that already divides)
+    gx, gy = grid
+    h, w = ch.shape
+    if h % gy == 0 and w % gx == 0:
+        return ch
+    return cv2.copyMakeBorder(ch, 0, gy - h % gy, 0, gx - w % gx, cv2.BORDER_REFLECT_101)
+
+
+def _band(ext: np.ndarray, out: np.ndarray, clip: float, grid: Tuple[int, int], r0: int, r1: int, rows_out: int):
+    gx, gy = grid
+    th = ext.shape[0] // gy
+    y0, y1 = r0 * th, min(r1 * th, rows_out)
+    if y1 <= y0:
+        return  # band lies entirely in the grid padding
+    h0, h1 = max(r0 - 1, 0), min(r1 + 1, gy)
+    with clahe_object(clip, (gx, h1 - h0)) as obj:
+        res = obj.apply(ext[h0 * th:h1 * th])
+    out[y0:y1] = res[(r0 - h0) * th:(r0 - h0) * th + (y1 - y0), :out.shape[1]]
+
+
+def apply_channel(ch: np.ndarray, clip: float = 2.0, grid: Tuple[int, int] = (8, 8),
+                  bands: Optional[int] = None) -> np.ndarray:
+    """CLAHE of one uint8 channel, split into horizontal bands of tile rows for large inputs."""
+    gx, gy = grid
+    if bands is None:
+        bands = _workers if ch.size >= PARALLEL_MIN_PIXELS and cv2.getNumThreads() <= 1 else 1
+    bands = min(bands, gy)
+    if bands <= 1:
+        with clahe_object(clip, grid) as obj:
+            return obj.apply(ch)
+    ext = _pad_to_grid(ch, grid)
+    out = np.empty_like(ch)
+    edges = np.linspace(0, gy, bands + 1).round().astype(int)
+    futures = [_executor.submit(_band, ext, out, clip, grid, int(r0), int(r1), ch.shape[0])
+               for r0, r1 in zip(edges[:-1], edges[1:]) if r1 > r0]
+    for f in futures:
+        f.result()
+    return out
+
+
+_SPACES = {
+    "lab": (cv2.COLOR_RGB2LAB, cv2.COLOR_LAB2RGB),
+    "ycrcb": (cv2.COLOR_RGB2YCrCb, cv2.COLOR_YCrCb2RGB),
+}
+
+
+def clahe(img: np.ndarray, clip: float = 2.0, grid: Tuple[int, int] = (8, 8), space: str = "lab",
+          bands: Optional[int] = None) -> np.ndarray:
+    """CLAHE on a gray image, or on the L (Lab) / Y (YCrCb) channel of an RGB image."""
+    if img.ndim == 2:
+        return apply_channel(img, clip, grid, bands)
+    fwd, inv = _SPACES[space]
+    conv = cv2.cvtColor(img, fwd)
+    conv[:, :, 0] = apply_channel(np.ascontiguousarray(conv[:, :, 0]), clip, grid, bands)
+    return cv2.cvtColor(conv, inv)
+
+# ------------------------------
+# Temporal CLAHE (video)
+# ------------------------------
+class TemporalCLAHE:
+    """CLAHE whose tile histograms are an exponential moving average over frames.
+
+    cv2.CLAHE recomputes each tile's LUT from the current frame only, so tiles
+    flicker as content moves through them. Here the per-tile histograms are
+    blended with weight `alpha` for the new frame before the usual clip,
+    redistribute and cumulative-sum steps; alpha=1 reproduces plain CLAHE.
+    With a SessionMemory (sessionmem.py) the histograms and the full-frame
+    tile index are kept there, counted against the session's budget.
+    """
+
+    def __init__(self, clip: float = 2.0, grid: Tuple[int, int] = (8, 8), alpha: float = 0.3,
+                 memory: Optional[Any] = None):
+        self.clip = clip
+        self.grid = (int(grid[0]), int(grid[1]))
+        self.alpha = alpha
+        self.memory = memory
+        self._state: Dict[str, Optional[np.ndarray]] = {}  # "hist" and "tile_id", when there is no memory
+        self._geom = None
+
+    def reset(self):
+        self._put("hist", None)
+
+    def _get(self, name: str) -> Optional[np.ndarray]:
+        if self.memory is None:
+            return self._state.get(name)
+        return self.memory.get(f"clahe:{id(self):x}:{name}")
+
+    def _put(self, name: str, array: Optional[np.ndarray]):
+        if self.memory is None:
+            self._state[name] = array
+        elif array is None:
+            self.memory.discard(f"clahe:{id(self):x}:{name}")
+        else:
+            self.memory.put(f"clahe:{id(self):x}:{name}", array)
+
+    def _geometry(self, shape: Tuple[int, int]):
+        if self._geom is not None and self._geom[0] == (shape, self.grid) and self._get("tile_id") is not None:
+            return self._geom[1]
+        gx, gy = self.grid
+        h, w = shape
+        eh, ew = (h, w) if (h % gy == 0 and w % gx == 0) else (h + gy - h % gy, w + gx - w % gx)
+        th, tw = eh // gy, ew // gx
+        tile_id = (np.arange(eh)[:, None] // th) * gx + (np.arange(ew)[None, :] // tw)
+        # Interpolation coordinates, as in cv2.CLAHE
+        tyf = np.arange(h, dtype=np.float32) / np.float32(th) - np.float32(0.5)
+        txf = np.arange(w, dtype=np.float32) / np.float32(tw) - np.float32(0.5)
+        ty1 = np.floor(tyf).astype(int)
+        tx1 = np.floor(txf).astype(int)
+        self._put("tile_id", (tile_id * 256).astype(np.int64))
+        geom = {
+            "tile_px": th * tw,
+            "ya": (tyf - ty1)[:, None], "xa": (txf - tx1)[None, :],
+            "ty1": np.clip(ty1, 0, gy - 1)[:, None], "ty2": np.clip(ty1 + 1, 0, gy - 1)[:, None],
+            "tx1": np.clip(tx1, 0, gx - 1)[None, :], "tx2": np.clip(tx1 + 1, 0, gx - 1)[None, :],
+        }
+        self._geom = ((shape, self.grid), geom)
+        self._put("hist", None)
+        return geom
+
+    def _luts(self, hist: np.ndarray, tile_px: int) -> np.ndarray:
+        limit = max(int(self.clip * tile_px / 256), 1) if self.clip > 0 else None
+        hist = np.floor(hist).astype(np.int64)
+        if limit is not None:
+            excess = np.maximum(hist - limit, 0).sum(axis=1)
+            hist = np.minimum(hist, limit) + (excess // 256)[:, None]
+            residual = excess % 256
+            step = np.maximum(256 // np.maximum(residual, 1), 1)[:, None]
+            p = np.arange(256)[None, :]
+            hist += ((p % step == 0) & (p // step < residual[:, None])).astype(np.int64)
+        scale = np.float32(255.0 / tile_px)
+        return np.clip(np.rint(np.cumsum(hist, axis=1) * scale), 0, 255).astype(np.float32)
+
+    def apply_channel(self, ch: np.ndarray) -> np.ndarray:
+        g = self._geometry(ch.shape)
+        gx, gy = self.grid
+        ext = _pad_to_grid(ch, self.grid)
+        counts = np.bincount((self._get("tile_id") + ext).ravel(), minlength=gx * gy * 256)
+        counts = counts.reshape(gx * gy, 256).astype(np.float64)
+        hist = self._get("hist")
+        hist = counts if hist is None else self.alpha * counts + (1.0 - self.alpha) * hist
+        self._put("hist", hist)
+        lut = self._luts(hist, g["tile_px"]).reshape(-1)
+        v = ch.astype(np.int64)
+        r1, r2 = g["ty1"] * gx, g["ty2"] * gx
+        top = lut[(r1 + g["tx1"]) * 256 + v] * (1 - g["xa"]) + lut[(r1 + g["tx2"]) * 256 + v] * g["xa"]
+        bot = lut[(r2 + g["tx1"]) * 256 + v] * (1 - g["xa"]) + lut[(r2 + g["tx2"]) * 256 + v] * g["xa"]
+        return np.clip(np.rint(top * (1 - g["ya"]) + bot * g["ya"]), 0, 255).astype(np.uint8)
+
+    def apply(self, img: np.ndarray, space: str = "lab") -> np.ndarray:
+        if img.ndim == 2:
+            return self.apply_channel(img)
+        fwd, inv = _SPACES[space]
+        conv = cv2.cvtColor(img, fwd)
+        conv[:, :, 0] = self.apply_channel(conv[:, :, 0])
+        return cv2.cvtColor(conv, inv)
@@ -0,0 +1,111 @@
+import threading
+import cv2
+import numpy as np
+from typing import Any, Dict, Optional, Tuple
+from display import content_key
+from imagebuf import freeze
+
+# ------------------------------
+# Colour-space-tagged images
+# ------------------------------
+# A ColorImage carries its pixels, the colour space they are in, free-form
+# metadata and a content hash. Every other representation (gray, HSV,
+# YCrCb, Lab, BGR, ...) is converted at most once and kept on the image, so
+# the branches of a rerun that all want e.g. the gray plane share one
+# conversion. A representation derived from another image remembers its
+# source: converting it back, or on to a third space, reads the source
+# instead of round-tripping through the lossy 8-bit intermediate.
+
+SPACES = ("RGB", "BGR", "GRAY", "HSV", "YCrCb", "Lab")
+# Spaces whose conversion from RGB keeps the colour information, so going back
+# to the source is the identity (up to 8-bit quantisation) and can be skipped
+_INVERTIBLE = {"BGR", "HSV", "YCrCb", "Lab"}
+
+
+def _code(src: str, dst: str) -> Optional[int]:
+    return getattr(cv2, f"COLOR_{src}2{dst}", None)
+
+
+class ColorImage:
+    __slots__ = ("data", "space", "meta", "_key", "_derived", "_source", "_lock")
+
+    def __init__(self, data: np.ndarray, space: str = "RGB", meta: Optional[Dict[str, Any]] = None,
+                 key: Optional[str] = None, source: Optional["ColorImage"] = None):
+        if space not in SPACES:
+            raise ValueError(f"Unknown colour space: {space}")
+        if (data.ndim == 2) != (space == "GRAY"):
+            raise ValueError(f"{space} image with shape {data.shape}")
+        self.data = freeze(data)
+        self.space = space
+        self.meta = meta if meta is not None else {}
+        self._key = key
+        self._derived: Dict[str, "ColorImage"] = {}
+        self._source = source
+        self._lock = threading.Lock()
+
+    @property
+    def key(self) -> str:
+        """Content hash of the pixels (computed on first use unless given)."""
+        if self._key is None:
+            self._key = content_key(self.data)
+        return self._key
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.data.shape
+
+    @property
+    def nbytes(self) -> int:
+        """Pixels plus every conversion memoized so far."""
+        with self._lock:
+            derived = list(self._derived.values())
+        return self.data.nbytes + sum(img.nbytes for img in derived)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or np.dtype(dtype) == self.data.dtype:
+            return self.data.copy() if copy else self.data
+        return self.data.astype(dtype)
+
+    def as_space(self, space: str) -> "ColorImage":
+        """This image in another colour space; each conversion runs once per image."""
+        if space == self.space:
+            return self
+        if self._source is not None and self.space in _INVERTIBLE:
+            return self._source.as_space(space)
+        with self._lock:
+            img = self._derived.get(space)
+        if img is not None:
+            return img
+        code = _code(self.space, space)
+        if code is not None:
+            data = cv2.cvtColor(self.data, code)
+        elif self.space != "RGB":
+            data = cv2.cvtColor(self.as_space("RGB").data, _code("RGB", space))
+        else:
+            raise ValueError(f"No conversion from {self.space} to {space}")
+        img = ColorImage(data, space, self.meta, f"{self.key}:{space}", source=self)
+        with self._lock:
+            return self._derived.setdefault(space, img)
+
+    def to(self, space: str) -> np.ndarray:
+        """Read-only pixels in `space` (see as_space)."""
+        return self.as_space(space).data
+
+    @property
+    def rgb(self) -> np.ndarray:
+        return self.to("RGB")
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self.to("GRAY")
+
+
+def decode_rgb(data: bytes) -> Optional[np.ndarray]:
+    """Decode an upload to 3-channel RGB (gray files expanded, alpha dropped); None if unreadable."""
+    bgr = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if bgr is None:
+        return None
+    if bgr.ndim == 2:
+        return cv2.cvtColor(bgr, cv2.COLOR_GRAY2RGB)
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
@@ -0,0 +1,151 @@
+import threading
+import cv2
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+from metrics import compare as quality_metrics
+
+# ------------------------------
+# Compare views
+# ------------------------------
+# Everything a compare view needs is derived once per (original, processed,
+# display width) and cached: both sides aligned, 3-channel and downscaled
+# to the panel, their absolute difference, the per-pixel max channel
+# difference and the signed luma difference. Moving the wipe divider or the
+# threshold/gain sliders then only slices, compares or looks up cached
+# buffers instead of re-copying and re-converting full frames.
+
+VIEWS = ("Wipe", "Absolute difference", "Signed difference", "Change mask")
+
+
+def _diverging_lut() -> np.ndarray:
+    # blue (processed darker) -> white (no change) -> red (processed brighter), RGB
+    t = np.abs(np.arange(256, dtype=np.float32) - 128) / 128
+    lut = np.empty((256, 1, 3), np.uint8)
+    fade = np.round(255 * (1 - t)).astype(np.uint8)
+    lut[:, 0, 0] = np.where(np.arange(256) >= 128, 255, fade)
+    lut[:, 0, 1] = fade
+    lut[:, 0, 2] = np.where(np.arange(256) < 128, 255, fade)
+    return lut
+
+
+_DIVERGING = _diverging_lut()
+_lock = threading.Lock()
+
+
+def _rgb(img: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2RGB) if img.ndim == 2 else img
+
+
+def _fit(img: np.ndarray, width: int) -> np.ndarray:
+    h, w = img.shape[:2]
+    if w <= width:
+        return img
+    return cv2.resize(img, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+
+
+_fitted: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+
+
+def _fitted_side(full: np.ndarray, key: Optional[str], width: int) -> np.ndarray:
+    # The original is shared by every pair made while it is loaded: downscale it once
+    if key is None:
+        return _fit(full, width)
+    k = (key, full.shape, width)
+    with _lock:
+        img = _fitted.get(k)
+        if img is not None:
+            _fitted.move_to_end(k)
+            return img
+    img = _fit(full, width)
+    with _lock:
+        _fitted[k] = img
+        while len(_fitted) > 4:
+            _fitted.popitem(last=False)
+    return img
+
+
+class ComparePair:
+    def __init__(self, left: np.ndarray, right: np.ndarray, width: int, left_key: Optional[str] = None,
+                 right_key: Optional[str] = None):
+        self.left_src, self.right_src = left, right  # held so id()-based keys stay unique
+        h = min(left.shape[0], right.shape[0])
+        w = min(left.shape[1], right.shape[1])
+        # Full-resolution aligned sides are views unless a gray side needs expanding
+        self.full_left = _rgb(left[:h, :w])
+        self.full_right = _rgb(right[:h, :w])
+        self.left = _fitted_side(self.full_left, left_key, width)
+        self.right = _fitted_side(self.full_right, right_key, width)
+        self.absdiff = cv2.absdiff(self.left, self.right)
+        self.maxdiff = self.absdiff.max(axis=2)
+        self.signed = (cv2.cvtColor(self.right, cv2.COLOR_RGB2GRAY).astype(np.int16)
+                       - cv2.cvtColor(self.left, cv2.COLOR_RGB2GRAY).astype(np.int16))
+        self._quality: Dict[tuple, Dict[str, float]] = {}
+
+    def wipe(self, pos: float, line: bool = True) -> np.ndarray:
+        """Original left of the divider, processed right of it; pos in [0, 1]."""
+        x = int(round(pos * self.left.shape[1]))
+        out = np.concatenate([self.left[:, :x], self.right[:, x:]], axis=1)
+        if line and 0 < x < out.shape[1]:
+            out[:, max(x - 1, 0):x + 1] = (255, 255, 0)
+        return out
+
+    def abs_diff(self, gain: float = 1.0) -> np.ndarray:
+        return self.absdiff if gain == 1 else cv2.convertScaleAbs(self.absdiff, alpha=gain)
+
+    def signed_diff(self, gain: float = 1.0) -> np.ndarray:
+        idx = np.clip(self.signed * gain + 128, 0, 255).astype(np.uint8)
+        return cv2.LUT(cv2.merge([idx, idx, idx]), _DIVERGING)
+
+    def change_mask(self, threshold: int = 25, overlay: bool = True) -> np.ndarray:
+        mask = self.maxdiff > threshold
+        if not overlay:
+            return mask.astype(np.uint8) * 255
+        out = (self.left // 2) + 64  # dimmed original
+        out[mask] = (255, 0, 0)
+        return out
+
+    def changed_fraction(self, threshold: int = 25) -> float:
+        return float(np.count_nonzero(self.maxdiff > threshold)) / self.maxdiff.size
+
+    def quality(self, metrics: Sequence[str] = ("psnr", "ssim", "ms_ssim"), downsample="auto") -> Dict[str, float]:
+        """Metrics between the aligned sides, computed once per pair.
+
+        The default downsample="auto" shrinks large images first (metrics.auto_factor);
+        pass downsample=None for full resolution.
+        """
+        k = (tuple(metrics), downsample)
+        if k not in self._quality:
+            self._quality[k] = quality_metrics(self.full_left, self.full_right, metrics, downsample=downsample)
+        return self._quality[k]
+
+    def view(self, name: str, pos: float = 0.5, gain: float = 1.0, threshold: int = 25) -> np.ndarray:
+        if name == "Wipe":
+            return self.wipe(pos)
+        if name == "Absolute difference":
+            return self.abs_diff(gain)
+        if name == "Signed difference":
+            return self.signed_diff(gain)
+        if name == "Change mask":
+            return self.change_mask(threshold)
+        raise ValueError(f"Unknown view: {name}")
+
+
+_pairs: "OrderedDict[tuple, ComparePair]" = OrderedDict()
+
+
+def compare_pair(left: np.ndarray, right: np.ndarray, width: int, left_key: Optional[str] = None,
+                 right_key: Optional[str] = None, max_entries: int = 4) -> ComparePair:
+    """Cached ComparePair; without content keys the arrays' identities are used."""
+    key = (left_key or id(left), right_key or id(right), width)
+    with _lock:
+        pair = _pairs.get(key)
+        if pair is not None and (left_key or pair.left_src is left) and (right_key or pair.right_src is right):
+            _pairs.move_to_end(key)
+            return pair
+    pair = ComparePair(left, right, width, left_key, right_key)
+    with _lock:
+        _pairs[key] = pair
+        while len(_pairs) > max_entries:
+            _pairs.popitem(last=False)
+    return pair
@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from probe import probe_bytes, probe_file
+
+# ------------------------------
+# Reduced-resolution decode planning
+# ------------------------------
+# libjpeg can decode at 1/2, 1/4 or 1/8 scale by keeping only the low DCT
+# coefficients. This is several times faster than a full decode and skips
+# most of the pixels a preview would throw away. Given the header (probe.py)
+# and the size a preview needs, the planner picks the strongest reduction
+# that still covers that size. Other formats have no scaled decoder (OpenCV
+# would decode fully and resize), so they keep the full decode and callers
+# downscale as usual. Save/export, Image Info and processing still use the
+# full decode.
+#
+# Orientation is ignored like the app's IMREAD_UNCHANGED decode, so a
+# preview always lines up with the full image.
+
+FACTORS = (8, 4, 2)
+SCALABLE = {"jpeg"}
+_COLOR = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+          8: cv2.IMREAD_REDUCED_COLOR_8}
+_GRAY = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+         8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+
+class DecodePlan(NamedTuple):
+    factor: int  # 1 = full decode
+    flags: int  # cv2.imread/imdecode flags
+    size: Tuple[int, int]  # (width, height) the decode will produce
+
+
+def reduction(width: int, height: int, target_w: int, target_h: Optional[int] = None) -> int:
+    """Largest scale factor whose output (ceil(w/f) x ceil(h/f)) still covers the target."""
+    for f in FACTORS:
+        if -(-width // f) >= target_w and (target_h is None or -(-height // f) >= target_h):
+            return f
+    return 1
+
+
+def plan(header: Optional[Dict[str, Any]], target_w: int, target_h: Optional[int] = None,
+         gray: bool = False) -> DecodePlan:
+    """Decode plan for a probed header; unknown or non-JPEG input gets the full decode."""
+    flags = _GRAY if gray else _COLOR
+    if header is None:
+        return DecodePlan(1, flags[1] | cv2.IMREAD_IGNORE_ORIENTATION, (0, 0))
+    w, h = header["width"], header["height"]
+    f = reduction(w, h, target_w, target_h) if header["format"] in SCALABLE and target_w else 1
+    return DecodePlan(f, flags[f] | cv2.IMREAD_IGNORE_ORIENTATION, (-(-w // f), -(-h // f)))
+
+
+def _to_rgb(img: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    if img is None or img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def decode_preview(data: bytes, target_w: int, target_h: Optional[int] = None,
+                   gray: bool = False) -> Optional[np.ndarray]:
+    """The encoded image at the smallest planned resolution covering the target (RGB or gray)."""
+    p = plan(probe_bytes(data), target_w, target_h, gray)
+    return _to_rgb(cv2.imdecode(np.frombuffer(data, np.uint8), p.flags))
+
+
+def read_preview(path: str, target_w: int, target_h: Optional[int] = None,
+                 gray: bool = False) -> Optional[np.ndarray]:
+    """decode_preview for a file; only the header is read to plan the decode."""
+    p = plan(probe_file(path), target_w, target_h, gray)
+    return _to_rgb(cv2.imread(path, p.flags))
@@ -0,0 +1,90 @@
+import hashlib
+import threading
+import cv2
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+# ------------------------------
+# Display transport
+# ------------------------------
+# Handing st.image a raw array makes Streamlit PNG-encode it at full size on
+# every rerun. Previews are instead downscaled to the panel width, encoded
+# with a lossy codec on a worker thread (cv2.imencode releases the GIL, so the
+# panels encode side by side) and cached by (content key, width, codec,
+# quality). An unchanged panel costs a dict lookup.
+
+CODECS = {"jpeg": ".jpg", "webp": ".webp", "png": ".png"}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="display-encode")
+_cache: "OrderedDict[tuple, Future]" = OrderedDict()
+_lock = threading.Lock()
+MAX_ENTRIES = 32
+
+
+def downscale(img: np.ndarray, width: int) -> np.ndarray:
+    h, w = img.shape[:2]
+    if w <= width:
+        return img
+    return cv2.resize(img, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+
+
+def content_key(img: np.ndarray) -> str:
+    h = hashlib.blake2b(np.ascontiguousarray(img).data, digest_size=16)
+    h.update(repr((img.shape, img.dtype.str)).encode())
+    return h.hexdigest()
+
+
+def _encode(img: np.ndarray, codec: str, quality: int) -> bytes:
+    if img.dtype != np.uint8:
+        img = np.clip(img, 0, 255).astype(np.uint8)
+    if img.ndim == 3 and img.shape[2] == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    elif img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_RGBA2BGRA if codec != "jpeg" else cv2.COLOR_RGBA2BGR)
+    params = []
+    if codec == "jpeg":
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    elif codec == "webp":
+        params = [int(cv2.IMWRITE_WEBP_QUALITY), quality]
+    ok, buf = cv2.imencode(CODECS[codec], img, params)
+    if not ok:
+        raise ValueError(f"Could not encode preview as {codec}")
+    return buf.tobytes()
+
+
+def submit_preview(img: Optional[np.ndarray], width: int, key: Optional[str] = None, codec: str = "jpeg",
+                   quality: int = 85, load: Optional[Callable[[], np.ndarray]] = None) -> Future:
+    """Start (or reuse) the encode of a display preview; result() gives the encoded bytes.
+
+    Pass `key` when the caller already knows the content (e.g. a hash of the
+    uploaded file); otherwise the downscaled preview itself is hashed. With a
+    key, `img` may be None and `load` produce the pixels instead (e.g. a
+    reduced-resolution decode); it runs on the worker, and only on a miss.
+    """
+    small = None
+    if key is None:
+        small = downscale(img, width)
+        key = content_key(small)
+    k = (key, width, codec, quality)
+    with _lock:
+        fut = _cache.get(k)
+        if fut is not None:
+            _cache.move_to_end(k)
+            return fut
+        if small is None and img is None:
+            fut = _executor.submit(lambda: _encode(downscale(load(), width), codec, quality))
+        else:
+            if small is None:
+                small = downscale(img, width)
+            fut = _executor.submit(_encode, small, codec, quality)
+        _cache[k] = fut
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return fut
+
+
+def preview_bytes(img: np.ndarray, width: int, key: Optional[str] = None, codec: str = "jpeg",
+                  quality: int = 85) -> bytes:
+    return submit_preview(img, width, key, codec, quality).result()
@@ -0,0 +1,88 @@
+"""Find near-duplicate images under a directory.
+
+    python dupes.py photos/ --hash phash --radius 6
+    python dupes.py photos/ --db images.db            # reuse dHashes from imgindex.py
+
+Hashes are compared through multi-index hashing, so the search does not
+compare every pair of images.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import cv2
+import numpy as np
+from imghash import THUMBS, group_pairs, hash_batch, near_duplicate_pairs, thumbnail
+from imgindex import ImageIndex, walk
+
+
+def _thumb(path: str, kind: str) -> Optional[np.ndarray]:
+    # Decoded in colour and reduced by the toolkit's RGB->gray, like the app's query and imgindex,
+    # so a file hashes the same whichever path hashed it
+    bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+    if bgr is None:
+        return None
+    return thumbnail(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), kind)
+
+
+def hash_files(paths: List[str], kind: str = "dhash", workers: Optional[int] = None) -> Tuple[List[str], np.ndarray]:
+    """Decode + thumbnail on a thread pool, then hash all thumbnails in one batch."""
+    with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+        thumbs = list(pool.map(lambda p: _thumb(p, kind), paths, chunksize=16))
+    ok = [i for i, t in enumerate(thumbs) if t is not None]
+    if not ok:
+        return [], np.empty(0, np.uint64)
+    return [paths[i] for i in ok], hash_batch(np.stack([thumbs[i] for i in ok]), kind)
+
+
+def find_groups(paths: List[str], hashes: np.ndarray, radius: int) -> List[List[Tuple[str, int]]]:
+    """Groups of near-duplicates as (path, distance to the group's first image), largest first."""
+    i, j, _ = near_duplicate_pairs(hashes, radius)
+    groups = []
+    for g in group_pairs(len(paths), i, j):
+        d = [int(bin(int(hashes[g[0]]) ^ int(hashes[k])).count("1")) for k in g]
+        groups.append([(paths[k], dk) for k, dk in zip(g, d)])
+    return sorted(groups, key=len, reverse=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Group near-duplicate images by perceptual hash")
+    ap.add_argument("root")
+    ap.add_argument("--hash", choices=sorted(THUMBS), default="dhash")
+    ap.add_argument("--radius", type=int, default=6, help="max Hamming distance (of 64 bits)")
+    ap.add_argument("--db", help="imgindex database to update and read dHashes from")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--json", help="write the groups to this file")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    root = os.path.abspath(args.root)
+    if args.db:
+        if args.hash != "dhash":
+            raise SystemExit("the index stores dHash only; drop --db or use --hash dhash")
+        with ImageIndex(args.db) as index:
+            index.update(root, args.workers)
+            paths, hashes = index.hashes()
+        keep = [k for k, p in enumerate(paths) if p.startswith(os.path.join(root, ""))]
+        paths, hashes = [paths[k] for k in keep], hashes[keep]
+    else:
+        paths, hashes = hash_files([p for p, _, _ in walk(root)], args.hash, args.workers)
+    t1 = time.perf_counter()
+    groups = find_groups(paths, hashes, args.radius)
+    t2 = time.perf_counter()
+
+    for g in groups:
+        print(f"{len(g)} images:")
+        for path, d in g:
+            print(f"  [{d:2d}] {path}")
+    print(f"{len(paths)} images hashed in {t1 - t0:.2f} s, {len(groups)} groups "
+          f"({sum(map(len, groups))} images) found in {t2 - t1:.2f} s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([[{"path": p, "distance": d} for p, d in g] for g in groups], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
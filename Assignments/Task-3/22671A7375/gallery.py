@@ -0,0 +1,199 @@
+import hashlib
+import os
+import threading
+import cv2
+import numpy as np
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from colorimage import ColorImage, decode_rgb
+from decodeplan import decode_preview
+from display import downscale
+from jobs import CancelToken
+from pipeline import run_pipeline
+from sessionmem import SessionMemory, memory_manager
+from utils import encode_format, to_3channel
+
+# ------------------------------
+# Multi-image gallery
+# ------------------------------
+# A session can hold a few hundred uploads. Thumbnails are produced on a
+# background pool from a reduced-resolution decode, as soon as a file is
+# added. Full images are decoded only when selected, and the last
+# `max_decoded` of them are kept (LRU) in a SessionMemory, where they count
+# against the session's budget and may be spilled; those the shared cache
+# decoded are held there only weakly. Applying a pipeline to one or all
+# images runs on a pool. Each worker decodes, processes and encodes its
+# image, then lets it go, so a batch over the whole gallery never holds
+# more than `workers` full frames.
+
+_thumb_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="thumb")
+_apply_pool = ThreadPoolExecutor(max_workers=max(2, min(4, os.cpu_count() or 1)), thread_name_prefix="gallery")
+
+
+def _thumbnail(data: bytes, width: int, quality: int) -> Optional[bytes]:
+    img = decode_preview(data, width)
+    if img is None:
+        return None
+    small = downscale(img, width)
+    ok, buf = cv2.imencode(".jpg", cv2.cvtColor(small, cv2.COLOR_RGB2BGR) if small.ndim == 3 else small,
+                           [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return buf.tobytes() if ok else None
+
+
+class GalleryItem:
+    __slots__ = ("name", "data", "key", "thumb")
+
+    def __init__(self, name: str, data: bytes, key: str, thumb: Future):
+        self.name = name
+        self.data = data
+        self.key = key
+        self.thumb = thumb
+
+
+class Gallery:
+    def __init__(self, thumb_width: int = 192, max_decoded: int = 6, thumb_quality: int = 80,
+                 memory: Optional[SessionMemory] = None):
+        self.thumb_width = thumb_width
+        self.max_decoded = max_decoded
+        self.thumb_quality = thumb_quality
+        self.items: "OrderedDict[str, GalleryItem]" = OrderedDict()
+        self.selected: Optional[str] = None
+        self._memory = memory if memory is not None else memory_manager().session()
+        self._decoded: "OrderedDict[str, None]" = OrderedDict()  # LRU of keys whose pixels are in _memory
+        self._keys: Dict[Any, str] = {}  # uploader file id -> content key, so files are read and hashed once
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def sync(self, files: Sequence[Any]):
+        """Match the gallery to the uploader's current files; new ones start their thumbnail.
+
+        files are uploaded-file objects with .name and .getvalue() (and .file_id, as
+        Streamlit's UploadedFile has); duplicates by content appear once.
+        """
+        items = OrderedDict()
+        for f in files:
+            fid = getattr(f, "file_id", None)
+            key = self._keys.get(fid) if fid is not None else None
+            item = self.items.get(key) if key is not None else None
+            if item is None:
+                data = f.getvalue()
+                key = hashlib.blake2b(data, digest_size=16).hexdigest()
+                item = self.items.get(key) or items.get(key)
+                if item is None:
+                    item = GalleryItem(f.name, data, key,
+                                       _thumb_pool.submit(_thumbnail, data, self.thumb_width, self.thumb_quality))
+                if fid is not None:
+                    self._keys[fid] = key
+            items.setdefault(key, item)
+        self._keys = {fid: k for fid, k in self._keys.items() if k in items}
+        for key in set(self.items) - set(items):
+            self.items[key].thumb.cancel()
+        self.items = items
+        with self._lock:
+            for key in [k for k in self._decoded if k not in items]:
+                self._forget(key)
+        if self.selected not in items:
+            self.selected = next(iter(items), None)
+
+    def select(self, key: str):
+        if key in self.items:
+            self.selected = key
+
+    @property
+    def current(self) -> Optional[GalleryItem]:
+        return None if self.selected is None else self.items[self.selected]
+
+    def thumbnail(self, key: str, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Encoded JPEG thumbnail, or None if it is not ready within `timeout` or unreadable."""
+        fut = self.items[key].thumb
+        try:
+            return fut.result(timeout)
+        except Exception:
+            return None
+
+    def image(self, key: str) -> Optional[ColorImage]:
+        """Full-resolution image, decoded on first use and kept for the last max_decoded selections."""
+        with self._lock:
+            rgb = self._recall(key)
+            if rgb is not None:
+                self._decoded.move_to_end(key)
+                return ColorImage(rgb, "RGB", key=key)
+        rgb = decode_rgb(self.items[key].data)
+        if rgb is None:
+            return None
+        self._remember(key, rgb, borrowed=False)
+        return ColorImage(rgb, "RGB", key=key)
+
+    def keep(self, key: str, img: ColorImage) -> ColorImage:
+        """Retain an image the shared cache decoded (held weakly, the cache owns it) as the most recent selection."""
+        self._remember(key, img.rgb, borrowed=True)
+        return img
+
+    def _recall(self, key: str) -> Optional[np.ndarray]:
+        # Caller holds the lock; None once the pixels are gone (a borrowed image the cache let go)
+        if key not in self._decoded:
+            return None
+        rgb = self._memory.get(f"gallery:{key}")
+        if rgb is None:
+            del self._decoded[key]
+        return rgb
+
+    def _remember(self, key: str, rgb: np.ndarray, borrowed: bool):
+        with self._lock:
+            self._memory.put(f"gallery:{key}", rgb, borrowed)
+            self._decoded[key] = None
+            self._decoded.move_to_end(key)
+            while len(self._decoded) > self.max_decoded:
+                self._forget(next(iter(self._decoded)))
+
+    def _forget(self, key: str):
+        del self._decoded[key]
+        self._memory.discard(f"gallery:{key}")
+
+    def _run_one(self, item: GalleryItem, steps: List[Dict[str, Any]], ext: str, token: Optional[CancelToken]) -> bytes:
+        if token is not None:
+            token.check()
+        with self._lock:
+            rgb = self._recall(item.key)
+        if rgb is None:
+            rgb = decode_rgb(item.data)
+        if rgb is None:
+            raise ValueError(f"could not decode {item.name}")
+        out = encode_format(to_3channel(run_pipeline(rgb, steps)), ext)
+        if out is None:
+            raise ValueError(f"could not encode {item.name} as {ext}")
+        return out
+
+    def apply(self, keys: Sequence[str], steps: List[Dict[str, Any]], ext: str = ".png",
+              progress: Optional[Callable[[int, int], None]] = None,
+              token: Optional[CancelToken] = None) -> Iterator[Tuple[str, Optional[bytes], Optional[Exception]]]:
+        """Run a pipeline on the given images in parallel; yields (key, encoded result, error) as they finish."""
+        futs = {_apply_pool.submit(self._run_one, self.items[k], steps, ext, token): k for k in keys}
+        done = 0
+        try:
+            for fut in as_completed(futs):
+                done += 1
+                if progress is not None:
+                    progress(done, len(futs))
+                err = fut.exception()
+                yield futs[fut], (None if err else fut.result()), err
+        finally:
+            for fut in futs:
+                fut.cancel()
+
+
+def output_name(name: str, ext: str) -> str:
+    return f"{os.path.splitext(name)[0]}_processed{ext}"
+
+
+def output_names(items: Sequence[GalleryItem], ext: str) -> Dict[str, str]:
+    """Output file name per item key; uploads that share a file name get their content key appended."""
+    counts = Counter(output_name(item.name, ext) for item in items)
+    names = {}
+    for item in items:
+        name = output_name(item.name, ext)
+        names[item.key] = name if counts[name] == 1 else f"{os.path.splitext(name)[0]}_{item.key[:8]}{ext}"
+    return names
@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+# ------------------------------
+# Histogram service
+# ------------------------------
+# One (C, 256) int64 table per image feeds equalization, contrast stretching,
+# Canny auto-thresholds and the histogram plots, instead of each of them
+# re-binning (or sorting, for np.percentile) millions of pixels.
+
+# calcHist counts in float32, which stops being exact past 2^24 per bin, so
+# larger images are binned in bands and summed as int64
+_BAND_PIXELS = 1 << 24
+
+
+def channel_histograms(img: np.ndarray, stride: int = 1) -> np.ndarray:
+    """Per-channel 256-bin histograms of a uint8 image, optionally on a strided subsample."""
+    if stride > 1:
+        img = img[::stride, ::stride]
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    h, w = img.shape[:2]
+    rows = max(1, _BAND_PIXELS // max(w, 1))
+    out = np.zeros((channels, 256), np.int64)
+    for y in range(0, h, rows):
+        band = img[y:y + rows]
+        for c in range(channels):
+            out[c] += cv2.calcHist([band], [c], None, [256], [0, 256]).ravel().astype(np.int64)
+    return out
+
+
+class HistogramService:
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._hists = OrderedDict()
+
+    def get(self, img: np.ndarray, key: Optional[str] = None, stride: int = 1) -> np.ndarray:
+        """Histograms of `img`; cached under `key` (a content hash) when one is given."""
+        if key is None:
+            return channel_histograms(img, stride)
+        k = (key, stride)
+        hist = self._hists.get(k)
+        if hist is None:
+            hist = channel_histograms(img, stride)
+            self._hists[k] = hist
+            while len(self._hists) > self.max_entries:
+                self._hists.popitem(last=False)
+        else:
+            self._hists.move_to_end(k)
+        return hist
+
+    def luma(self, img_rgb: np.ndarray, key: Optional[str] = None, stride: int = 1) -> np.ndarray:
+        """256-bin histogram of the Y (YCrCb) channel; the conversion only runs on a cache miss."""
+        k = None if key is None else f"{key}:Y"
+        if k is not None and (k, stride) in self._hists:
+            return self.get(img_rgb, k, stride)[0]
+        y = img_rgb if img_rgb.ndim == 2 else cv2.cvtColor(img_rgb, cv2.COLOR_RGB2YCrCb)[:, :, 0]
+        return self.get(y, k, stride)[0]
+
+    def preview_stride(self, img: np.ndarray, max_pixels: int = 1_000_000) -> int:
+        h, w = img.shape[:2]
+        return max(1, int(np.sqrt(h * w / max_pixels)))
+
+
+hist_service = HistogramService()
+
+# ------------------------------
+# Consumers
+# ------------------------------
+def equalize_lut(hist: np.ndarray) -> np.ndarray:
+    """The lookup table cv2.equalizeHist builds from a 256-bin histogram."""
+    hist = np.asarray(hist, np.int64)
+    total = int(hist.sum())
+    nz = np.flatnonzero(hist)
+    if total == 0:
+        return np.arange(256, dtype=np.uint8)
+    first = nz[0]
+    if hist[first] == total:
+        return np.full(256, first, np.uint8)
+    # Same float32 arithmetic as OpenCV (255.f / n, then sum * scale), so rounding matches
+    scale = np.float32(255) / np.float32(total - hist[first])
+    cdf = (np.cumsum(hist) - hist[first]).astype(np.float32)
+    lut = np.clip(np.rint(cdf * scale), 0, 255).astype(np.uint8)
+    lut[:first + 1] = 0
+    return lut
+
+
+def percentile(hist: np.ndarray, q: float) -> float:
+    """np.percentile (linear interpolation) of the pixels behind a 256-bin histogram."""
+    cdf = np.cumsum(hist)
+    rank = q / 100.0 * (cdf[-1] - 1)
+    lo = int(np.floor(rank))
+    v_lo = int(np.searchsorted(cdf, lo, side="right"))
+    v_hi = int(np.searchsorted(cdf, min(lo + 1, cdf[-1] - 1), side="right"))
+    return v_lo + (rank - lo) * (v_hi - v_lo)
+
+
+def median(hist: np.ndarray) -> float:
+    return percentile(hist, 50)
+
+
+def plot_histograms(hists: Sequence[np.ndarray], labels: Sequence[str], title: str = ""):
+    """Matplotlib figure drawn from the 256-value arrays only."""
+    import matplotlib.pyplot as plt
+    colors = {"R": "red", "G": "green", "B": "blue"}
+    fig, ax = plt.subplots(figsize=(6, 2.5))
+    x = np.arange(256)
+    for hist, label in zip(hists, labels):
+        ax.plot(x, hist, color=colors.get(label, "black"), label=label, linewidth=1)
+        ax.fill_between(x, hist, color=colors.get(label, "gray"), alpha=0.15)
+    ax.set_xlim(0, 255)
+    ax.set_title(title)
+    ax.legend(loc="upper right", fontsize="small")
+    fig.tight_layout()
+    return fig
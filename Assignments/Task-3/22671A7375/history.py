@@ -0,0 +1,155 @@
+import time
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional
+from imagebuf import freeze
+from pipeline import apply_step
+from sessionmem import SessionMemory, memory_manager
+
+# ------------------------------
+# Undo / redo history
+# ------------------------------
+# An editing session is the base image plus a list of (op, params) steps in
+# the pipeline JSON format. Only some states are kept as pixels: the base,
+# a checkpoint every `checkpoint_every` steps and after any step slower
+# than `slow_seconds`. Any other state is rebuilt by replaying the steps
+# from the nearest checkpoint at or before it. Checkpoints are kept under
+# a byte budget. When it is exceeded, the checkpoint whose loss adds the
+# least replay time goes first, so undo and redo stay cheap while memory
+# stays bounded. Checkpoints and the current state live in a SessionMemory,
+# where they also count against the session's budget and may be spilled;
+# the base is held directly, as the shared cache already owns it.
+
+
+class EditHistory:
+    def __init__(self, base: np.ndarray, budget_bytes: int = 256 << 20, checkpoint_every: int = 4,
+                 slow_seconds: float = 0.25, apply: Callable[[np.ndarray, str, Dict[str, Any]], np.ndarray] = apply_step,
+                 memory: Optional[SessionMemory] = None):
+        self.budget_bytes = budget_bytes
+        self.checkpoint_every = checkpoint_every
+        self.slow_seconds = slow_seconds
+        self._apply = apply
+        self.steps: List[Dict[str, Any]] = []
+        self._seconds: List[float] = []  # time each step took when it last ran
+        self.cursor = 0  # number of steps applied in the current state
+        self._memory = memory if memory is not None else memory_manager().session()
+        self._prefix = f"history:{id(self):x}:"
+        self._base = freeze(base)
+        self._checkpoints: Dict[int, int] = {0: 0}  # step index -> bytes kept for it (the base is not counted)
+        self._current = 0  # step index whose pixels are kept as the current state
+        self.replayed = 0  # steps re-run to serve undo/redo, for the stats
+
+    # --- editing ---
+    def push(self, op: str, params: Dict[str, Any]) -> np.ndarray:
+        """Apply a step on top of the current state; anything that could be redone is dropped."""
+        prev = self.image()
+        del self.steps[self.cursor:], self._seconds[self.cursor:]
+        for i in [i for i in self._checkpoints if i > self.cursor]:
+            self._drop(i)
+        self.steps.append({"op": op, "params": dict(params)})
+        self._seconds.append(0.0)
+        self.cursor += 1
+        out = self._run(self.cursor - 1, prev)
+        checkpoint = self.cursor % self.checkpoint_every == 0 or self._seconds[-1] >= self.slow_seconds
+        if checkpoint:
+            self._checkpoints[self.cursor] = out.nbytes
+            self._memory.put(self._name(self.cursor), out)
+        self._hold_current(self.cursor, out)
+        if checkpoint:
+            self._enforce_budget()
+        return out
+
+    def undo(self) -> np.ndarray:
+        if self.can_undo:
+            self.cursor -= 1
+        return self.image()
+
+    def redo(self) -> np.ndarray:
+        if self.can_redo:
+            self.cursor += 1
+        return self.image()
+
+    def jump(self, index: int) -> np.ndarray:
+        """State after the first `index` steps."""
+        self.cursor = max(0, min(index, len(self.steps)))
+        return self.image()
+
+    @property
+    def can_undo(self) -> bool:
+        return self.cursor > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self.cursor < len(self.steps)
+
+    # --- rebuilding ---
+    def _run(self, i: int, img: np.ndarray) -> np.ndarray:
+        t0 = time.perf_counter()
+        out = freeze(self._apply(img, self.steps[i]["op"], self.steps[i]["params"]))
+        self._seconds[i] = time.perf_counter() - t0
+        return out
+
+    def image(self, index: Optional[int] = None) -> np.ndarray:
+        """Pixels after `index` steps (the cursor by default), replayed from the nearest checkpoint."""
+        index = self.cursor if index is None else index
+        if self._current == index:
+            return self._held(index)
+        start = max(i for i in self._checkpoints if i <= index)
+        if start < self._current <= index:
+            start = self._current
+        img = self._held(start)
+        for i in range(start, index):
+            img = self._run(i, img)
+            self.replayed += 1
+        self._hold_current(index, img)
+        return img
+
+    # --- kept pixels ---
+    def _name(self, index) -> str:
+        return f"{self._prefix}{index}"
+
+    def _held(self, index: int) -> np.ndarray:
+        # Pixels of a checkpoint or of the current state (read back from disk if they were spilled)
+        if index == 0:
+            return self._base
+        return self._memory.get(self._name(index if index in self._checkpoints else "current"))
+
+    def _hold_current(self, index: int, img: np.ndarray):
+        # A checkpoint already keeps its pixels; any other current state is kept on its own
+        self._current = index
+        if index in self._checkpoints:
+            self._memory.discard(self._name("current"))
+        else:
+            self._memory.put(self._name("current"), img)
+
+    def _drop(self, index: int):
+        if index == self._current:
+            self._memory.put(self._name("current"), self._held(index))
+        del self._checkpoints[index]
+        self._memory.discard(self._name(index))
+
+    def _enforce_budget(self):
+        # The base is never dropped; each other checkpoint is worth the replay time back to the one before it
+        while self.checkpoint_bytes > self.budget_bytes and len(self._checkpoints) > 1:
+            keys = sorted(self._checkpoints)
+            worth = {k: sum(self._seconds[p:k]) for p, k in zip(keys, keys[1:])}
+            self._drop(min(worth, key=worth.get))
+
+    def close(self):
+        """Release the kept checkpoints and current state from the session's memory."""
+        for i in [i for i in self._checkpoints if i]:
+            self._drop(i)
+        self._memory.discard(self._name("current"))
+
+    # --- introspection ---
+    @property
+    def checkpoint_bytes(self) -> int:
+        return sum(self._checkpoints.values())
+
+    def pipeline(self) -> List[Dict[str, Any]]:
+        """The steps applied in the current state, as a JSON pipeline."""
+        return [dict(s) for s in self.steps[:self.cursor]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"steps": len(self.steps), "cursor": self.cursor, "checkpoints": sorted(self._checkpoints),
+                "checkpoint_bytes": self.checkpoint_bytes, "budget_bytes": self.budget_bytes,
+                "replayed_steps": self.replayed}
@@ -0,0 +1,20 @@
+import numpy as np
+
+# ------------------------------
+# Read-only image buffers
+# ------------------------------
+# Arrays that are shared between reruns and caches (the decoded upload,
+# cached results) are exposed read-only, so no caller has to take a
+# defensive copy "in case" someone else writes into them: every operation
+# already returns a new buffer, and an accidental in-place write raises
+# instead of corrupting the shared frame. Code that really wants to edit
+# pixels copies explicitly, at that moment.
+
+
+def freeze(arr: np.ndarray) -> np.ndarray:
+    """Read-only view of arr (no pixel copy); arrays that are already read-only come back as is."""
+    if not arr.flags.writeable:
+        return arr
+    view = arr.view()
+    view.flags.writeable = False
+    return view
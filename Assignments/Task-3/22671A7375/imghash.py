@@ -0,0 +1,219 @@
+import itertools
+from math import comb
+import cv2
+import numpy as np
+from typing import Any, Iterable, List, Optional, Tuple
+from utils import ensure_gray
+
+# ------------------------------
+# Perceptual hashes
+# ------------------------------
+# 64-bit hashes that change little under re-encoding, resizing and mild
+# colour edits; the Hamming distance between two hashes measures similarity.
+# Images are reduced to small gray thumbnails once, and whole batches of
+# thumbnails are hashed with array ops (one matrix product for every pHash DCT).
+
+# kind -> thumbnail (width, height)
+THUMBS = {"ahash": (8, 8), "dhash": (9, 8), "phash": (32, 32)}
+
+
+def to_signed(h: int) -> int:
+    """uint64 hash -> int64 (what SQLite INTEGER columns hold)."""
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def to_unsigned(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
+
+
+def thumbnail(img: np.ndarray, kind: str = "dhash") -> np.ndarray:
+    return cv2.resize(ensure_gray(img), THUMBS[kind], interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def _pack(bits: np.ndarray) -> np.ndarray:
+    return np.packbits(bits.reshape(len(bits), 64), axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def hash_batch(thumbs: np.ndarray, kind: str = "dhash") -> np.ndarray:
+    """uint64 hashes of a stack of thumbnails shaped (N, h, w) as produced by thumbnail()."""
+    t = np.asarray(thumbs, np.float32)
+    if kind == "ahash":
+        bits = t > t.mean(axis=(1, 2), keepdims=True)
+    elif kind == "dhash":
+        bits = t[:, :, 1:] > t[:, :, :-1]
+    elif kind == "phash":
+        low = (_DCT32 @ t @ _DCT32.T)[:, :8, :8].reshape(len(t), 64)
+        bits = low > np.median(low[:, 1:], axis=1, keepdims=True)  # DC term left out of the median
+    else:
+        raise ValueError(f"Unknown hash: {kind}")
+    return _pack(bits)
+
+
+def image_hash(img: np.ndarray, kind: str = "dhash") -> int:
+    return int(hash_batch(thumbnail(img, kind)[None], kind)[0])
+
+
+def dhash(img: np.ndarray) -> int:
+    """Difference hash: sign of horizontal gradients on a 9x8 area-averaged thumbnail."""
+    return image_hash(img, "dhash")
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return np.unpackbits(x.view(np.uint8).reshape(*x.shape, 8), axis=-1).sum(axis=-1, dtype=np.uint8)
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return popcount(np.bitwise_xor(np.asarray(a, np.uint64), np.asarray(b, np.uint64)))
+
+
+# ------------------------------
+# BK-tree
+# ------------------------------
+class BKTree:
+    """Metric tree over Hamming distance; supports incremental adds and radius queries."""
+
+    def __init__(self):
+        self._root: Optional[list] = None  # [hash, items, {distance: child}]
+        self.size = 0
+
+    def add(self, h: int, item: Any = None):
+        self.size += 1
+        if self._root is None:
+            self._root = [h, [item], {}]
+            return
+        node = self._root
+        while True:
+            d = (node[0] ^ h).bit_count()
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [item], {}]
+                return
+            node = child
+
+    def query(self, h: int, radius: int) -> List[Tuple[int, Any]]:
+        """(distance, item) for every stored hash within `radius` of h, nearest first."""
+        out = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            d = (node[0] ^ h).bit_count()
+            if d <= radius:
+                out.extend((d, item) for item in node[1])
+            # Triangle inequality: only children at distance d +- radius can hold matches
+            for cd, child in node[2].items():
+                if d - radius <= cd <= d + radius:
+                    stack.append(child)
+        return sorted(out, key=lambda r: r[0])
+
+
+# ------------------------------
+# All near-duplicate pairs (multi-index hashing)
+# ------------------------------
+# Split the 64 bits into m chunks. If two hashes differ in at most r bits,
+# some chunk differs in at most r // m bits (pigeonhole), so candidates are
+# found by probing, per chunk, every value within r // m of each hash's chunk
+# in a sorted table, then verified on the full hash. m is picked from a cost
+# model (probes + expected bucket hits for uniformly spread hashes, measured
+# weights).
+
+
+def _chunks(m: int) -> List[Tuple[int, int]]:
+    edges = np.linspace(0, 64, m + 1).round().astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _flip_masks(bits: int, radius: int) -> np.ndarray:
+    masks = [0]
+    for k in range(1, radius + 1):
+        masks += [sum(1 << b for b in c) for c in itertools.combinations(range(bits), k)]
+    return np.array(masks, np.uint64)
+
+
+def _n_probes(bits: int, radius: int) -> int:
+    return sum(comb(bits, k) for k in range(radius + 1))
+
+
+# A sorted-table probe costs about as much as verifying a dozen candidates
+_PROBE_COST = 12.0
+
+
+def choose_chunks(n: int, radius: int) -> int:
+    best, best_cost = 2, None
+    for m in range(2, 17):
+        probes = _n_probes(-(-64 // m), radius // m)
+        cost = m * n * probes * (_PROBE_COST + n / 2.0 ** (64 / m))
+        if best_cost is None or cost < best_cost:
+            best, best_cost = m, cost
+    return best
+
+
+def near_duplicate_pairs(hashes: np.ndarray, radius: int, chunks: Optional[int] = None,
+                         block: int = 1 << 16) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """All pairs i < j with Hamming(hashes[i], hashes[j]) <= radius, as (i, j, distance) arrays."""
+    h = np.asarray(hashes, np.uint64)
+    n = len(h)
+    m = chunks or choose_chunks(n, radius)
+    found = []
+    for lo, hi in _chunks(m):
+        mask = np.uint64((1 << (hi - lo)) - 1)
+        vals = (h >> np.uint64(lo)) & mask
+        order = np.argsort(vals, kind="stable")
+        sorted_vals = vals[order]
+        for f in _flip_masks(hi - lo, radius // m):
+            for b0 in range(0, n, block):
+                q = vals[b0:b0 + block] ^ f
+                start = np.searchsorted(sorted_vals, q, "left")
+                counts = np.searchsorted(sorted_vals, q, "right") - start
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+                i = np.repeat(np.arange(b0, b0 + len(q)), counts)
+                offs = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                j = order[np.repeat(start, counts) + offs]
+                keep = i < j  # each unordered pair is seen from both ends
+                i, j = i[keep], j[keep]
+                d = hamming(h[i], h[j])
+                keep = d <= radius
+                found.append(i[keep].astype(np.int64) * n + j[keep])
+    if not found:
+        empty = np.empty(0, np.int64)
+        return empty, empty, np.empty(0, np.uint8)
+    pairs = np.unique(np.concatenate(found))  # a pair can match in several chunks
+    i, j = pairs // n, pairs % n
+    return i, j, hamming(h[i], h[j])
+
+
+def group_pairs(n: int, i: Iterable[int], j: Iterable[int]) -> List[List[int]]:
+    """Connected groups (size >= 2) of the near-duplicate graph, via union-find."""
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(i, j):
+        ra, rb = find(int(a)), find(int(b))
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    groups = {}
+    for x in range(n):
+        groups.setdefault(find(x), []).append(x)
+    return [g for g in groups.values() if len(g) > 1]
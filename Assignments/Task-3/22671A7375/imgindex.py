@@ -0,0 +1,234 @@
+"""SQLite catalogue of an image tree.
+
+    python imgindex.py index photos/ --db images.db --workers 8
+    python imgindex.py stats --db images.db
+    python imgindex.py show photos/cat.jpg --db images.db
+
+Each row holds path, size, mtime, dimensions, channels, format, DPI (from a
+header-only probe), per-channel 256-bin histograms and a 64-bit dHash.
+Re-indexing compares size and mtime against the stored row, so only new or
+changed files are read and decoded; rows of deleted files are pruned.
+"""
+import argparse
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import cv2
+import numpy as np
+from histogram import channel_histograms
+from imghash import dhash, to_signed, to_unsigned
+from probe import probe_bytes
+
+EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff", ".gif"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path       TEXT PRIMARY KEY,
+    size       INTEGER NOT NULL,
+    mtime_ns   INTEGER NOT NULL,
+    width      INTEGER,
+    height     INTEGER,
+    channels   INTEGER,
+    format     TEXT,
+    dpi_x      REAL,
+    dpi_y      REAL,
+    hist       BLOB,
+    dhash      INTEGER,
+    error      TEXT,
+    indexed_at REAL
+);
+CREATE INDEX IF NOT EXISTS images_dhash ON images (dhash);
+"""
+
+_COLUMNS = ("path", "size", "mtime_ns", "width", "height", "channels", "format",
+            "dpi_x", "dpi_y", "hist", "dhash", "error", "indexed_at")
+
+
+# ------------------------------
+# Scanning
+# ------------------------------
+def walk(root: str) -> Iterator[Tuple[str, int, int]]:
+    """(path, size, mtime_ns) for every image under root; scandir supplies the stat for free."""
+    stack = [root]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for e in sorted(entries, key=lambda e: e.name):
+            if e.is_dir(follow_symlinks=False):
+                stack.append(e.path)
+            elif os.path.splitext(e.name)[1].lower() in EXTS:
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                yield e.path, st.st_size, st.st_mtime_ns
+
+
+def describe(path: str, size: int, mtime_ns: int) -> Tuple:
+    """One row for `path`: probe the header, decode once for histograms and hash."""
+    row = dict.fromkeys(_COLUMNS)
+    row.update(path=path, size=size, mtime_ns=mtime_ns, indexed_at=time.time())
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        info = probe_bytes(data)
+        if info is not None:
+            row.update(width=info["width"], height=info["height"], channels=info["channels"], format=info["format"])
+            if info["dpi"] is not None:
+                row["dpi_x"], row["dpi_y"] = info["dpi"]
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_ANYCOLOR)
+        if img is None:
+            raise ValueError("could not decode")
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        if info is None:
+            row.update(width=img.shape[1], height=img.shape[0], channels=1 if img.ndim == 2 else img.shape[2],
+                       format=os.path.splitext(path)[1].lower().strip("."))
+        row["hist"] = channel_histograms(img).astype("<u4").tobytes()
+        row["dhash"] = to_signed(dhash(img))
+    except (OSError, ValueError, cv2.error) as exc:
+        row["error"] = str(exc)
+    return tuple(row[c] for c in _COLUMNS)
+
+
+def _bounded_map(pool: ThreadPoolExecutor, fn: Callable, items: Iterator[tuple], window: int) -> Iterator[Any]:
+    # Keeps at most `window` decodes in flight so a 1M-file walk never queues 1M futures
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, *item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# ------------------------------
+# Index
+# ------------------------------
+class ImageIndex:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _known(self, root: str) -> Dict[str, Tuple[int, int]]:
+        prefix = os.path.join(root, "")
+        rows = self.conn.execute("SELECT path, size, mtime_ns FROM images WHERE path >= ? AND path < ?",
+                                 (prefix, prefix + "\U0010ffff"))
+        return {p: (s, m) for p, s, m in rows}
+
+    def update(self, root: str, workers: Optional[int] = None, batch: int = 1000,
+               progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+        """Bring the rows under `root` in line with the tree; returns counts per outcome."""
+        root = os.path.abspath(root)
+        known = self._known(root)
+        stats = {"scanned": 0, "unchanged": 0, "added": 0, "updated": 0, "removed": 0, "failed": 0}
+        changed = deque()  # per queued file: new (True) or modified (False), in submission order
+
+        def todo():
+            for path, size, mtime_ns in walk(root):
+                stats["scanned"] += 1
+                old = known.pop(path, None)
+                if old == (size, mtime_ns):
+                    stats["unchanged"] += 1
+                    continue
+                changed.append(old is None)
+                yield path, size, mtime_ns
+
+        workers = workers or min(8, os.cpu_count() or 1)
+        sql = f"INSERT OR REPLACE INTO images ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+        rows: List[Tuple] = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="index") as pool:
+            for row in _bounded_map(pool, describe, todo(), 4 * workers):
+                stats["added" if changed.popleft() else "updated"] += 1
+                stats["failed"] += row[_COLUMNS.index("error")] is not None
+                rows.append(row)
+                if len(rows) >= batch:
+                    with self.conn:
+                        self.conn.executemany(sql, rows)
+                    rows.clear()
+                    if progress is not None:
+                        progress(stats)
+        # Whatever is left in `known` was not seen on disk any more
+        with self.conn:
+            self.conn.executemany(sql, rows)
+            self.conn.executemany("DELETE FROM images WHERE path = ?", ((p,) for p in known))
+        stats["removed"] = len(known)
+        if progress is not None:
+            progress(stats)
+        return stats
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        cur = self.conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM images WHERE path = ?", (os.path.abspath(path),))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        rec = dict(zip(_COLUMNS, row))
+        if rec["hist"] is not None:
+            rec["hist"] = np.frombuffer(rec["hist"], "<u4").reshape(-1, 256)
+        if rec["dhash"] is not None:
+            rec["dhash"] = to_unsigned(rec["dhash"])
+        return rec
+
+    def hashes(self) -> Tuple[List[str], np.ndarray]:
+        """All indexed paths with their dHash as a uint64 array."""
+        rows = self.conn.execute("SELECT path, dhash FROM images WHERE dhash IS NOT NULL ORDER BY path").fetchall()
+        return [r[0] for r in rows], np.array([r[1] for r in rows], np.int64).view(np.uint64)
+
+    def stats(self) -> Dict[str, Any]:
+        n, failed, pixels = self.conn.execute(
+            "SELECT COUNT(*), COUNT(error), SUM(CAST(width AS INTEGER) * height) FROM images").fetchone()
+        formats = dict(self.conn.execute("SELECT format, COUNT(*) FROM images GROUP BY format ORDER BY 2 DESC"))
+        return {"images": n, "failed": failed, "megapixels": round((pixels or 0) / 1e6, 1), "formats": formats}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Catalogue images in SQLite")
+    ap.add_argument("--db", default="images.db")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("index", help="scan a tree and (re)index new or changed files")
+    p.add_argument("root")
+    p.add_argument("--workers", type=int, default=None)
+    sub.add_parser("stats", help="summary of the index")
+    p = sub.add_parser("show", help="print the row of one file")
+    p.add_argument("path")
+    args = ap.parse_args()
+
+    with ImageIndex(args.db) as index:
+        if args.cmd == "index":
+            t0 = time.perf_counter()
+            stats = index.update(args.root, args.workers,
+                                 progress=lambda s: print(f"\r{s['scanned']} scanned, "
+                                                          f"{s['added'] + s['updated']} indexed", end="", flush=True))
+            print(f"\n{stats} in {time.perf_counter() - t0:.2f} s")
+        elif args.cmd == "stats":
+            print(index.stats())
+        else:
+            rec = index.get(args.path)
+            if rec is None:
+                raise SystemExit("not indexed")
+            hist = rec.pop("hist")
+            rec["dhash"] = None if rec["dhash"] is None else f"{rec['dhash']:016x}"
+            print(rec)
+            if hist is not None:
+                print("histogram totals per channel:", hist.sum(axis=1).tolist())
+
+
+if __name__ == "__main__":
+    main()
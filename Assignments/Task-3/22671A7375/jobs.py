@@ -0,0 +1,155 @@
+import os
+import threading
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from pipeline import apply_step, local_radius
+from imagebuf import freeze
+
+# ------------------------------
+# Background jobs
+# ------------------------------
+# Long operations run on a shared worker pool instead of the Streamlit script
+# thread. Each output (e.g. one session's processed panel) owns a JobSlot:
+# every submit bumps the slot's generation, cancels the job it supersedes and
+# only a job that is still the newest when it finishes may publish its
+# result. Tiled runners check their CancelToken between bands, so a stale
+# median filter stops at the next band instead of finishing the frame.
+
+_executor = ThreadPoolExecutor(max_workers=max(2, min(4, os.cpu_count() or 1)), thread_name_prefix="job")
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled()
+
+
+class Job:
+    def __init__(self, generation: int, key: Any, token: CancelToken):
+        self.generation = generation
+        self.key = key
+        self.token = token
+        self.future: Optional[Future] = None
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        try:
+            self.future.result(timeout)
+        except Exception:
+            pass
+        return self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+
+# What a job's future resolves to when its array result went to the slot's memory
+STORED = object()
+
+
+class JobSlot:
+    def __init__(self, memory: Optional[Any] = None, borrowed: bool = False):
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.current: Optional[Job] = None
+        self.last: Optional[Tuple[Any, Any]] = None  # (key, result) of the newest completed job
+        # Optional SessionMemory (sessionmem.py): array results are kept only there, where they
+        # count against the memory budget and may be spilled; `last` and the job's future hold
+        # no pixels. borrowed=True when fn's results are owned by a cache (e.g. cached_step):
+        # the memory then only holds them weakly and does not count them again.
+        self.memory = memory
+        self.borrowed = borrowed
+
+    def submit(self, key: Any, fn: Callable, *args, **kwargs) -> Job:
+        """Run fn(*args, token=..., **kwargs) unless the current job already has this key."""
+        with self._lock:
+            cur = self.current
+            if cur is not None and cur.key == key and not cur.token.cancelled:
+                if not cur.done() or cur.future.exception() is None:
+                    return cur
+            if cur is not None:
+                cur.token.cancel()
+                if cur.future is not None:
+                    cur.future.cancel()
+            self.generation += 1
+            job = Job(self.generation, key, CancelToken())
+            self.current = job
+            job.future = _executor.submit(self._run, job, fn, args, kwargs)
+            return job
+
+    def _run(self, job: Job, fn: Callable, args: tuple, kwargs: Dict[str, Any]):
+        job.token.check()
+        result = fn(*args, token=job.token, **kwargs)
+        if isinstance(result, np.ndarray):
+            result = freeze(result)  # handed to every later rerun as `last`
+        with self._lock:
+            if job.generation == self.generation:
+                if self.memory is not None and isinstance(result, np.ndarray):
+                    self.memory.put("job_last", result, self.borrowed)
+                    self.last = (job.key, None)
+                    return STORED
+                self.last = (job.key, result)
+            else:
+                raise Cancelled()  # superseded while running: drop the result
+        return result
+
+    def result(self, job: Job) -> Optional[Any]:
+        """A finished job's result; arrays kept in the slot's memory are read back from there."""
+        value = job.result()
+        return self.last_result() if value is STORED else value
+
+    def last_result(self) -> Optional[Any]:
+        if self.last is None:
+            return None
+        if self.last[1] is None and self.memory is not None:
+            return self.memory.get("job_last")
+        return self.last[1]
+
+
+def run_tiled(fn: Callable[[np.ndarray], np.ndarray], img: np.ndarray, halo: int,
+              token: Optional[CancelToken] = None, band_rows: int = 512) -> np.ndarray:
+    """Apply a size-preserving local filter band by band, checking `token` at each band boundary.
+
+    Each band is read with `halo` extra rows above and below, so any operation
+    whose output depends on at most `halo` rows of neighbourhood gives the
+    same pixels as a single call on the whole image.
+    """
+    h = img.shape[0]
+    out = None
+    for y0 in range(0, h, band_rows):
+        if token is not None:
+            token.check()
+        y1 = min(y0 + band_rows, h)
+        a0, a1 = max(y0 - halo, 0), min(y1 + halo, h)
+        res = fn(img[a0:a1])
+        if out is None:
+            out = np.empty((h,) + res.shape[1:], res.dtype)
+        out[y0:y1] = res[y0 - a0:y0 - a0 + (y1 - y0)]
+    return out
+
+
+def run_step(img: np.ndarray, op: str, params: Dict[str, Any], token: Optional[CancelToken] = None) -> np.ndarray:
+    """One pipeline step, tiled when the op is local so it can be cancelled between bands."""
+    radius = local_radius(op, params, img.dtype)
+    if radius is None:
+        if token is not None:
+            token.check()
+        return apply_step(img, op, params)
+    return run_tiled(lambda band: apply_step(band, op, params), img, radius, token)
@@ -0,0 +1,52 @@
+"""Load-test client for server.py.
+
+    python loadtest.py sample.jpg --op gaussian_filter --param k=9 -n 200 -c 16
+"""
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+import numpy as np
+
+
+def call(url: str, data: bytes) -> float:
+    t0 = time.perf_counter()
+    req = urllib.request.Request(url, data=data, method="POST", headers={"Content-Type": "application/octet-stream"})
+    with urllib.request.urlopen(req) as resp:
+        resp.read()
+    return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fire concurrent requests at the toolkit HTTP service")
+    ap.add_argument("image")
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--op", default="gaussian_filter")
+    ap.add_argument("--param", action="append", default=[], help="name=value, repeatable")
+    ap.add_argument("--format", default="jpg")
+    ap.add_argument("-n", "--requests", type=int, default=100)
+    ap.add_argument("-c", "--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    with open(args.image, "rb") as f:
+        data = f.read()
+    query = dict(p.split("=", 1) for p in args.param)
+    query["format"] = args.format
+    url = f"{args.url}/op/{args.op}?{urlencode(query)}"
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        lat = np.array(list(ex.map(lambda _: call(url, data), range(args.requests)))) * 1000
+    wall = time.perf_counter() - t0
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {wall:.2f} s -> {args.requests / wall:.1f} req/s")
+    print(f"latency ms: mean {lat.mean():.1f}  p50 {np.percentile(lat, 50):.1f}  "
+          f"p95 {np.percentile(lat, 95):.1f}  max {lat.max():.1f}")
+    with urllib.request.urlopen(f"{args.url}/metrics") as resp:
+        print(json.dumps(json.loads(resp.read()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import math
+import os
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+# ------------------------------
+# Image quality metrics
+# ------------------------------
+# MSE / PSNR / SSIM / MS-SSIM between a reference and a test image of the
+# same size. mode="luma" compares BT.601 luma (what compression artefacts
+# are judged on), mode="per_channel" returns one value per channel plus
+# their mean. SSIM statistics come from separable cv2 filters in float32
+# and are computed in row bands with a halo, so huge images never hold
+# more than a few bands of float intermediates and give the same result.
+
+MODES = ("luma", "per_channel")
+WINDOWS = {"gaussian": 11, "box": 7}
+MS_WEIGHTS = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+_BAND_ROWS = 64
+
+_band_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="ssim")
+
+
+def _planes(img: np.ndarray, mode: str) -> List[np.ndarray]:
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    if img.ndim == 2:
+        return [img]
+    if mode == "luma":
+        # 8-bit luma like encoders measure it; float input stays float
+        return [cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)]
+    return [img[:, :, c] for c in range(img.shape[2])]
+
+
+def _check(a: np.ndarray, b: np.ndarray):
+    if a.shape != b.shape:
+        raise ValueError(f"Shape mismatch: {a.shape} vs {b.shape}")
+
+
+def _summary(values: List[float]) -> Dict[str, object]:
+    return {"value": float(np.mean(values)), "channels": [float(v) for v in values]}
+
+
+def _mse_plane(x: np.ndarray, y: np.ndarray) -> float:
+    if x.dtype == np.uint8 and y.dtype == np.uint8:
+        return cv2.norm(x, y, cv2.NORM_L2SQR) / x.size
+    d = x.astype(np.float32) - y.astype(np.float32)
+    return float(np.dot(d.ravel(), d.ravel())) / d.size
+
+
+def _psnr(mse: float, data_range: float = 255.0) -> float:
+    return math.inf if mse == 0 else 10.0 * math.log10(data_range ** 2 / mse)
+
+
+def mse(a: np.ndarray, b: np.ndarray, mode: str = "luma") -> Dict[str, object]:
+    _check(a, b)
+    return _summary([_mse_plane(x, y) for x, y in zip(_planes(a, mode), _planes(b, mode))])
+
+
+def psnr(a: np.ndarray, b: np.ndarray, mode: str = "luma") -> Dict[str, object]:
+    _check(a, b)
+    vals = [_mse_plane(x, y) for x, y in zip(_planes(a, mode), _planes(b, mode))]
+    # The mean PSNR is taken over the mean MSE, not averaged in dB
+    return {"value": _psnr(float(np.mean(vals))), "channels": [_psnr(v) for v in vals]}
+
+
+# ------------------------------
+# SSIM
+# ------------------------------
+def _filter(x: np.ndarray, window: str) -> np.ndarray:
+    if window == "gaussian":
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+    return cv2.blur(x, (7, 7))
+
+
+def _ssim_band(x: np.ndarray, y: np.ndarray, window: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(SSIM map, contrast-structure map) of two planes; arithmetic is in place to save passes."""
+    x, y = x.astype(np.float32), y.astype(np.float32)
+    mx, my = _filter(x, window), _filter(y, window)
+    sxy = _filter(x * y, window)
+    x *= x
+    y *= y
+    sx, sy = _filter(x, window), _filter(y, window)
+    mxy = mx * my
+    mx *= mx
+    my *= my
+    sx -= mx
+    sy -= my
+    sxy -= mxy
+    # cs = (2 sxy + C2) / (sx + sy + C2)
+    sx += sy
+    sx += _C2
+    sxy *= 2
+    sxy += _C2
+    sxy /= sx
+    # ssim = cs * (2 mx my + C1) / (mx^2 + my^2 + C1)
+    mx += my
+    mx += _C1
+    mxy *= 2
+    mxy += _C1
+    mxy /= mx
+    mxy *= sxy
+    return mxy, sxy
+
+
+def _band_sums(x: np.ndarray, y: np.ndarray, window: str, y0: int, y1: int) -> Tuple[float, float]:
+    halo = WINDOWS[window] // 2
+    a0, a1 = max(y0 - halo, 0), min(y1 + halo, x.shape[0])
+    s, cs = _ssim_band(x[a0:a1], y[a0:a1], window)
+    return float(s[y0 - a0:y1 - a0].sum(dtype=np.float64)), float(cs[y0 - a0:y1 - a0].sum(dtype=np.float64))
+
+
+def _downsample(x: np.ndarray, f: int) -> np.ndarray:
+    h, w = x.shape[:2]
+    return cv2.resize(x[:h - h % f, :w - w % f], (w // f, h // f), interpolation=cv2.INTER_AREA)
+
+
+def auto_factor(shape: Tuple[int, ...]) -> int:
+    """Downsampling factor of the reference SSIM implementation (Wang et al.): about 256 px on the short side."""
+    return max(1, round(min(shape[:2]) / 256))
+
+
+def _ssim_means(x: np.ndarray, y: np.ndarray, window: str, band_rows: int = _BAND_ROWS) -> Tuple[float, float]:
+    """Mean SSIM and mean contrast-structure over the plane.
+
+    Bands small enough for the intermediates to stay in cache run on a
+    thread pool; each is read with a halo of the window radius, so the sums
+    equal those of a single whole-plane pass.
+    """
+    h = x.shape[0]
+    bands = [(y0, min(y0 + band_rows, h)) for y0 in range(0, h, band_rows)]
+    if len(bands) == 1:
+        sums = [_band_sums(x, y, window, *bands[0])]
+    else:
+        sums = list(_band_pool.map(lambda b: _band_sums(x, y, window, *b), bands))
+    n = x.shape[0] * x.shape[1]
+    return sum(s for s, _ in sums) / n, sum(c for _, c in sums) / n
+
+
+def _prepare(a: np.ndarray, b: np.ndarray, window: str, downsample) -> Tuple[np.ndarray, np.ndarray]:
+    _check(a, b)
+    if window not in WINDOWS:
+        raise ValueError(f"Unknown window: {window}")
+    f = auto_factor(a.shape) if downsample == "auto" else int(downsample or 1)
+    if f > 1:
+        a, b = _downsample(a, f), _downsample(b, f)
+    return a, b
+
+
+def ssim(a: np.ndarray, b: np.ndarray, mode: str = "luma", window: str = "gaussian",
+         downsample=None) -> Dict[str, object]:
+    """downsample: None (full resolution), an integer factor or "auto" (see auto_factor)."""
+    a, b = _prepare(a, b, window, downsample)
+    return _summary([_ssim_means(x, y, window)[0] for x, y in zip(_planes(a, mode), _planes(b, mode))])
+
+
+def _ms_ssim_plane(x: np.ndarray, y: np.ndarray, window: str) -> float:
+    # Scales that would shrink the image below the window are dropped and the
+    # remaining weights renormalised
+    size = WINDOWS[window]
+    levels = 1
+    while levels < len(MS_WEIGHTS) and min(x.shape[:2]) >> levels >= size:
+        levels += 1
+    w = np.array(MS_WEIGHTS[:levels])
+    w /= w.sum()
+    out = 1.0
+    for j in range(levels):
+        s, cs = _ssim_means(x, y, window)
+        if j == levels - 1:
+            out *= max(s, 0.0) ** w[j]
+        else:
+            out *= max(cs, 0.0) ** w[j]
+            x, y = _downsample(x.astype(np.float32), 2), _downsample(y.astype(np.float32), 2)
+    return float(out)
+
+
+def ms_ssim(a: np.ndarray, b: np.ndarray, mode: str = "luma", window: str = "gaussian",
+            downsample=None) -> Dict[str, object]:
+    a, b = _prepare(a, b, window, downsample)
+    return _summary([_ms_ssim_plane(x, y, window) for x, y in zip(_planes(a, mode), _planes(b, mode))])
+
+
+# ------------------------------
+# Batch API
+# ------------------------------
+METRICS = {"mse": mse, "psnr": psnr, "ssim": ssim, "ms_ssim": ms_ssim}
+
+_executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="metrics")
+
+
+def compare(a: np.ndarray, b: np.ndarray, metrics: Sequence[str] = ("psnr", "ssim"),
+            mode: str = "luma", window: str = "gaussian", downsample=None) -> Dict[str, float]:
+    """{metric: mean value}; the luma plane is converted once and shared by all metrics.
+
+    `downsample` applies to SSIM and MS-SSIM only; MSE and PSNR always use every pixel.
+    """
+    _check(a, b)
+    if mode == "luma" and a.ndim == 3:
+        a, b = _planes(a, mode)[0], _planes(b, mode)[0]
+    out = {}
+    for m in metrics:
+        kwargs = {"window": window, "downsample": downsample} if m in ("ssim", "ms_ssim") else {}
+        out[m] = METRICS[m](a, b, mode, **kwargs)["value"]
+    return out
+
+
+def compare_batch(pairs: Sequence[Tuple[np.ndarray, np.ndarray]], metrics: Sequence[str] = ("psnr", "ssim"),
+                  mode: str = "luma", window: str = "gaussian", downsample=None) -> List[Dict[str, float]]:
+    """compare() over many pairs on a thread pool (cv2 filters release the GIL)."""
+    return list(_executor.map(lambda p: compare(p[0], p[1], metrics, mode, window, downsample), pairs))
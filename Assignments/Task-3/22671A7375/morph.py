@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+from typing import List, Tuple
+
+# ------------------------------
+# Morphology engine
+# ------------------------------
+# Rectangles are run as a horizontal and a vertical 1-D pass, with n
+# iterations of a k-window folded into one window of n*(k-1)+1. OpenCV already
+# does both for rectangles and its SIMD line kernels win up to a few hundred
+# pixels, so long windows only switch to the van Herk/Gil-Werman running
+# max/min, which costs about three comparisons per pixel whatever the length.
+# Cross and ellipse elements are unions of centred rectangles; OpenCV runs them
+# as full 2-D kernels, so past DECOMPOSE_MIN_K the union of 1-D passes wins.
+
+VHGW_MIN_K = 401
+DECOMPOSE_MIN_K = {"ellipse": 45, "cross": 41}
+
+SHAPES = {
+    "rect": cv2.MORPH_RECT,
+    "ellipse": cv2.MORPH_ELLIPSE,
+    "cross": cv2.MORPH_CROSS,
+}
+
+
+def _border_value(dtype: np.dtype, op: str):
+    # Padding that never wins the comparison, like OpenCV's default border
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+    else:
+        info = np.finfo(dtype)
+    return info.min if op == "dilate" else info.max
+
+
+def _vhgw(img: np.ndarray, k: int, anchor: int, axis: int, op: str) -> np.ndarray:
+    """van Herk/Gil-Werman running max/min of window k along one axis."""
+    ufunc = np.maximum if op == "dilate" else np.minimum
+    a = np.moveaxis(img, axis, 0)
+    n = a.shape[0]
+    total = -(-(n + k - 1) // k) * k  # padded length rounded up to whole blocks
+    pad = [(anchor, total - n - anchor)] + [(0, 0)] * (a.ndim - 1)
+    padded = np.pad(a, pad, constant_values=_border_value(img.dtype, op))
+    blocks = padded.reshape((total // k, k) + a.shape[1:])
+    prefix = ufunc.accumulate(blocks, axis=1).reshape(padded.shape)
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    out = ufunc(suffix[:n], prefix[k - 1:k - 1 + n])
+    return np.ascontiguousarray(np.moveaxis(out, 0, axis))
+
+
+def _line(img: np.ndarray, k: int, anchor: int, axis: int, op: str) -> np.ndarray:
+    if k <= 1:
+        return img
+    if k >= VHGW_MIN_K:
+        return _vhgw(img, k, anchor, axis, op)
+    if axis == 1:
+        kernel, cv_anchor = np.ones((1, k), np.uint8), (anchor, 0)
+    else:
+        kernel, cv_anchor = np.ones((k, 1), np.uint8), (0, anchor)
+    fn = cv2.dilate if op == "dilate" else cv2.erode
+    return fn(img, kernel, anchor=cv_anchor)
+
+
+def _direct(img: np.ndarray, kernel: np.ndarray, op: str, iterations: int) -> np.ndarray:
+    fn = cv2.dilate if op == "dilate" else cv2.erode
+    return fn(img, kernel, iterations=iterations)
+
+
+def _rect(img: np.ndarray, k: int, op: str, iterations: int = 1) -> np.ndarray:
+    size = iterations * (k - 1) + 1
+    if size < VHGW_MIN_K:
+        return _direct(img, np.ones((k, k), np.uint8), op, iterations)
+    # n passes of a k-window with anchor a == one pass of n*(k-1)+1 with anchor n*a
+    anchor = iterations * (k // 2)
+    return _line(_line(img, size, anchor, 1, op), size, anchor, 0, op)
+
+
+def decompose(shape: str, k: int) -> List[Tuple[int, int]]:
+    """Split a k x k structuring element into centred (width, height) rectangles whose union is the element."""
+    if shape == "rect":
+        return [(k, k)]
+    se = cv2.getStructuringElement(SHAPES[shape], (k, k))
+    widths = se.sum(axis=1)
+    rects = []
+    for w in sorted(set(int(x) for x in widths if x > 0)):
+        rects.append((w, int((widths >= w).sum())))
+    return rects
+
+
+def _pass(img: np.ndarray, shape: str, k: int, op: str, iterations: int) -> np.ndarray:
+    if shape == "rect":
+        return _rect(img, k, op, iterations)
+    # Rectangle unions reproduce the element only when every run is centred
+    # on the anchor, which holds for odd sizes
+    if k % 2 == 0 or k < DECOMPOSE_MIN_K[shape]:
+        return _direct(img, cv2.getStructuringElement(SHAPES[shape], (k, k)), op, iterations)
+    ufunc = np.maximum if op == "dilate" else np.minimum
+    rects = decompose(shape, k)
+    out = img
+    for _ in range(iterations):
+        src = out
+        rows = {}
+        acc = None
+        for w, h in rects:
+            if w not in rows:
+                rows[w] = _line(src, w, w // 2, 1, op)
+            part = _line(rows[w], h, h // 2, 0, op)
+            if acc is None:
+                acc = part if part is not src else part.copy()
+            else:
+                ufunc(acc, part, out=acc)
+        out = acc
+    return out
+
+
+def morph(img: np.ndarray, op: str, k: int, iterations: int = 1, shape: str = "rect") -> np.ndarray:
+    """Dilate/erode/open/close with a rect, ellipse or cross element of size k."""
+    if k <= 1 or iterations < 1:
+        return img
+    if op in ("dilate", "erode"):
+        return _pass(img, shape, k, op, iterations)
+    if op == "open":
+        return _pass(_pass(img, shape, k, "erode", iterations), shape, k, "dilate", iterations)
+    if op == "close":
+        return _pass(_pass(img, shape, k, "dilate", iterations), shape, k, "erode", iterations)
+    return img
@@ -0,0 +1,113 @@
+import numpy as np
+from typing import Any, Dict, List, Optional
+import utils
+from warp import WarpChain
+
+# ------------------------------
+# Operation registry
+# ------------------------------
+# A pipeline is a JSON-friendly list of steps: {"op": "<utils function>", "params": {...}}.
+# Only single-image operations are listed; point lists in params are coerced to float32.
+OPS = {
+    "rgb_to_hsv": utils.rgb_to_hsv,
+    "hsv_to_rgb": utils.hsv_to_rgb,
+    "rgb_to_ycrcb": utils.rgb_to_ycrcb,
+    "ycrcb_to_rgb": utils.ycrcb_to_rgb,
+    "rgb_to_gray": utils.rgb_to_gray,
+    "gray_to_rgb": utils.gray_to_rgb,
+    "rotate_image": utils.rotate_image,
+    "scale_image": utils.scale_image,
+    "translate_image": utils.translate_image,
+    "affine_transform": utils.affine_transform,
+    "perspective_transform": utils.perspective_transform,
+    "bitwise_not": utils.bitwise_not,
+    "mean_filter": utils.mean_filter,
+    "gaussian_filter": utils.gaussian_filter,
+    "median_filter": utils.median_filter,
+    "sobel_edges": utils.sobel_edges,
+    "laplacian_edges": utils.laplacian_edges,
+    "canny_edges": utils.canny_edges,
+    "morphology": utils.morphology,
+    "histogram_equalization": utils.histogram_equalization,
+    "contrast_stretch": utils.contrast_stretch,
+    "sharpen": utils.sharpen,
+    "jpeg_roundtrip": utils.jpeg_roundtrip,
+}
+
+# Edge detectors take a single channel, like the app feeds them
+GRAY_INPUT = {"sobel_edges", "laplacian_edges", "canny_edges"}
+
+# Geometric ops and the WarpChain method each one folds into
+GEOMETRIC = {
+    "rotate_image": "rotate",
+    "scale_image": "scale",
+    "translate_image": "translate",
+    "affine_transform": "affine",
+    "perspective_transform": "perspective",
+}
+
+
+# Neighbourhood radius (in rows) of size-preserving local ops, used to run
+# them in independent bands; global ops (normalisation, histograms, Canny
+# hysteresis, JPEG blocks) are not listed
+_POINTWISE = {"rgb_to_hsv", "hsv_to_rgb", "rgb_to_ycrcb", "ycrcb_to_rgb", "rgb_to_gray", "gray_to_rgb", "bitwise_not"}
+
+
+def _gaussian_taps(sigma: float, dtype) -> int:
+    # Kernel size cv2.GaussianBlur derives from sigma when ksize is (0, 0): 3 sigma a side for 8-bit, 4 otherwise
+    return int(round(sigma * (3 if np.dtype(dtype) == np.uint8 else 4) * 2 + 1)) | 1
+
+
+def local_radius(op: str, params: Dict[str, Any], dtype=np.uint8) -> Optional[int]:
+    if op in _POINTWISE:
+        return 0
+    if op in ("mean_filter", "gaussian_filter", "median_filter"):
+        return int(params["k"]) // 2 + 1
+    if op == "morphology":
+        passes = 2 if params.get("op") in ("open", "close") else 1
+        return passes * int(params.get("iterations", 1)) * int(params["k"])
+    if op == "sharpen":
+        return _gaussian_taps(3, dtype) // 2 + 1  # GaussianBlur(sigma=3): 19 taps for uint8, 25 for 16-bit
+    return None
+
+
+def _coerce(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: np.float32(v) if isinstance(v, (list, tuple)) and k.endswith("_pts") else v
+            for k, v in params.items()}
+
+
+def apply_step(img: np.ndarray, op: str, params: Dict[str, Any]) -> np.ndarray:
+    if op not in OPS:
+        raise ValueError(f"Unknown operation: {op}")
+    if op in GRAY_INPUT:
+        img = utils.ensure_gray(img)
+    return OPS[op](img, **_coerce(params))
+
+
+def _flush(img: np.ndarray, pending: List[Dict[str, Any]], fit: bool) -> np.ndarray:
+    if len(pending) == 1 and not fit:
+        # A lone step keeps its own interpolation choice (e.g. INTER_AREA downscale)
+        return apply_step(img, pending[0]["op"], pending[0].get("params", {}))
+    h, w = img.shape[:2]
+    chain = WarpChain((w, h))
+    for step in pending:
+        getattr(chain, GEOMETRIC[step["op"]])(**_coerce(step.get("params", {})))
+    return chain.apply(img, fit=fit)
+
+
+def run_pipeline(img: np.ndarray, steps: List[Dict[str, Any]], fuse_warps: bool = True,
+                 fit: bool = False) -> np.ndarray:
+    """Run steps in order, resampling each run of consecutive geometric steps only once."""
+    pending = []
+    for step in steps:
+        op = step["op"]
+        if fuse_warps and op in GEOMETRIC:
+            pending.append(step)
+            continue
+        if pending:
+            img = _flush(img, pending, fit)
+            pending = []
+        img = apply_step(img, op, step.get("params", {}))
+    if pending:
+        img = _flush(img, pending, fit)
+    return img
@@ -0,0 +1,172 @@
+import struct
+from typing import Any, Dict, Optional, Tuple
+
+# ------------------------------
+# Header-only image probe
+# ------------------------------
+# Format, dimensions, channel count and DPI read from the first bytes of a
+# file (JPEG JFIF/EXIF + SOF, PNG IHDR/pHYs, BMP, GIF, WebP, TIFF), so
+# cataloguing and decode planning never need a full decode.
+
+HEAD_BYTES = 256 * 1024
+_INCH = 0.0254  # metres
+
+
+def _result(fmt: str, w: int, h: int, channels: int, dpi: Optional[Tuple[float, float]] = None) -> Dict[str, Any]:
+    if dpi is not None:
+        dpi = (round(dpi[0], 2), round(dpi[1], 2))
+        if dpi[0] <= 0 or dpi[1] <= 0:
+            dpi = None
+    return {"format": fmt, "width": int(w), "height": int(h), "channels": int(channels), "dpi": dpi}
+
+
+def _tiff_ifd0(data: bytes, base: int = 0) -> Dict[int, Any]:
+    """Tags of the first IFD of a TIFF structure starting at `base` (also used for EXIF)."""
+    bo = "<" if data[base:base + 2] == b"II" else ">"
+    (off,) = struct.unpack_from(bo + "I", data, base + 4)
+    (n,) = struct.unpack_from(bo + "H", data, base + off)
+    tags = {}
+    for i in range(n):
+        e = base + off + 2 + 12 * i
+        if e + 12 > len(data):
+            break
+        tag, typ, count = struct.unpack_from(bo + "HHI", data, e)
+        if typ == 3:  # SHORT
+            tags[tag] = struct.unpack_from(bo + "H", data, e + 8)[0]
+        elif typ == 4:  # LONG
+            tags[tag] = struct.unpack_from(bo + "I", data, e + 8)[0]
+        elif typ == 5:  # RATIONAL, stored at an offset
+            (p,) = struct.unpack_from(bo + "I", data, e + 8)
+            if base + p + 8 <= len(data):
+                num, den = struct.unpack_from(bo + "II", data, base + p)
+                tags[tag] = num / den if den else 0.0
+    return tags
+
+
+def _tiff_dpi(tags: Dict[int, Any]) -> Optional[Tuple[float, float]]:
+    if 282 not in tags or 283 not in tags:
+        return None
+    unit = tags.get(296, 2)
+    if unit == 2:
+        return tags[282], tags[283]
+    if unit == 3:
+        return tags[282] * 2.54, tags[283] * 2.54
+    return None
+
+
+def _jpeg(data: bytes) -> Optional[Dict[str, Any]]:
+    i, dpi, exif_dpi = 2, None, None
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            break
+        (length,) = struct.unpack_from(">H", data, i + 2)
+        seg = data[i + 4:i + 2 + length]
+        if marker == 0xE0 and seg[:5] == b"JFIF\x00" and len(seg) >= 12:
+            units, xd, yd = struct.unpack_from(">BHH", seg, 7)
+            if units == 1:
+                dpi = (xd, yd)
+            elif units == 2:
+                dpi = (xd * 2.54, yd * 2.54)
+        elif marker == 0xE1 and seg[:6] == b"Exif\x00\x00":
+            try:
+                exif_dpi = _tiff_dpi(_tiff_ifd0(seg, 6))
+            except struct.error:
+                pass
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC) and len(seg) >= 6:
+            _, h, w, comps = struct.unpack_from(">BHHB", seg, 0)
+            return _result("jpeg", w, h, 1 if comps == 1 else 3, dpi or exif_dpi)
+        i += 2 + length
+    return None
+
+
+def _png(data: bytes) -> Optional[Dict[str, Any]]:
+    if len(data) < 33:
+        return None
+    w, h, _, color = struct.unpack_from(">IIBB", data, 16)
+    channels = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(color, 3)
+    dpi, i = None, 8
+    while i + 8 <= len(data):
+        length, ctype = struct.unpack_from(">I4s", data, i)
+        if ctype == b"pHYs" and i + 17 <= len(data):
+            px, py, unit = struct.unpack_from(">IIB", data, i + 8)
+            if unit == 1:
+                dpi = (px * _INCH, py * _INCH)
+        if ctype in (b"IDAT", b"IEND"):
+            break
+        i += 12 + length
+    return _result("png", w, h, channels, dpi)
+
+
+def _bmp(data: bytes) -> Optional[Dict[str, Any]]:
+    (dib,) = struct.unpack_from("<I", data, 14)
+    if dib == 12:
+        w, h, _, bits = struct.unpack_from("<HHHH", data, 18)
+        return _result("bmp", w, h, 4 if bits == 32 else 3)
+    w, h, _, bits = struct.unpack_from("<iiHH", data, 18)
+    xppm, yppm = struct.unpack_from("<ii", data, 38)
+    dpi = (xppm * _INCH, yppm * _INCH) if xppm > 0 and yppm > 0 else None
+    return _result("bmp", w, abs(h), 4 if bits == 32 else 3, dpi)
+
+
+def _webp(data: bytes) -> Optional[Dict[str, Any]]:
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        w, h = struct.unpack_from("<HH", data, 26)
+        return _result("webp", w & 0x3FFF, h & 0x3FFF, 3)
+    if chunk == b"VP8L" and len(data) >= 25:
+        (b,) = struct.unpack_from("<I", data, 21)
+        return _result("webp", (b & 0x3FFF) + 1, ((b >> 14) & 0x3FFF) + 1, 4 if (b >> 28) & 1 else 3)
+    if chunk == b"VP8X" and len(data) >= 30:
+        flags = data[20]
+        w = int.from_bytes(data[24:27], "little") + 1
+        h = int.from_bytes(data[27:30], "little") + 1
+        return _result("webp", w, h, 4 if flags & 0x10 else 3)
+    return None
+
+
+def _tiff(data: bytes) -> Optional[Dict[str, Any]]:
+    tags = _tiff_ifd0(data)
+    if 256 not in tags or 257 not in tags:
+        return None
+    return _result("tiff", tags[256], tags[257], tags.get(277, 1), _tiff_dpi(tags))
+
+
+def probe_bytes(data: bytes) -> Optional[Dict[str, Any]]:
+    """{format, width, height, channels, dpi} from the leading bytes of an encoded image, or None."""
+    try:
+        if data[:2] == b"\xff\xd8":
+            return _jpeg(data)
+        if data[:8] == b"\x89PNG\r\n\x1a\n":
+            return _png(data)
+        if data[:2] == b"BM":
+            return _bmp(data)
+        if data[:6] in (b"GIF87a", b"GIF89a"):
+            w, h = struct.unpack_from("<HH", data, 6)
+            return _result("gif", w, h, 3)
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return _webp(data)
+        if data[:4] in (b"II*\x00", b"MM\x00*"):
+            return _tiff(data)
+    except (struct.error, IndexError, ZeroDivisionError):
+        return None
+    return None
+
+
+def probe_file(path: str) -> Optional[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        head = f.read(HEAD_BYTES)
+        info = probe_bytes(head)
+        if info is None and head[:2] == b"\xff\xd8" and len(head) == HEAD_BYTES:
+            # SOF sits after a very large APP segment (big EXIF thumbnail / ICC profile)
+            info = probe_bytes(head + f.read())
+    return info
@@ -0,0 +1,106 @@
+import math
+import cv2
+import numpy as np
+from typing import Dict, List, Tuple
+
+# ------------------------------
+# Image pyramid + tile server
+# ------------------------------
+# Level 0 is the image itself, level n is 2^n times smaller (cv2.pyrDown).
+# Levels are built lazily, and a viewport request only touches the tiles it
+# overlaps at the coarsest level that still has at least one source pixel per
+# display pixel, so the browser never receives more than the viewport.
+
+TILE = 256
+
+
+class TilePyramid:
+    def __init__(self, img: np.ndarray, tile: int = TILE, min_side: int = 64):
+        self.tile = tile
+        self.levels: List[np.ndarray] = [img]
+        h, w = img.shape[:2]
+        self.max_level = max(0, int(math.log2(max(1, min(h, w) / min_side))))
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        h, w = self.levels[0].shape[:2]
+        return w, h
+
+    def level(self, n: int) -> np.ndarray:
+        n = min(max(n, 0), self.max_level)
+        while len(self.levels) <= n:
+            self.levels.append(cv2.pyrDown(self.levels[-1]))
+        return self.levels[n]
+
+    def level_for_zoom(self, zoom: float) -> int:
+        """Coarsest level whose resolution still covers `zoom` display px per source px."""
+        if zoom >= 1:
+            return 0
+        return min(int(math.floor(math.log2(1.0 / zoom))), self.max_level)
+
+    def grid(self, n: int) -> Tuple[int, int]:
+        h, w = self.level(n).shape[:2]
+        return -(-w // self.tile), -(-h // self.tile)
+
+    def get_tile(self, n: int, tx: int, ty: int) -> np.ndarray:
+        lvl = self.level(n)
+        t = self.tile
+        return lvl[ty * t:(ty + 1) * t, tx * t:(tx + 1) * t]
+
+    def tiles_for(self, n: int, box: Tuple[float, float, float, float]) -> List[Tuple[int, int]]:
+        """(tx, ty) of the level-n tiles overlapping a level-0 box (x0, y0, x1, y1)."""
+        sx, sy = self._scale(n)
+        cols, rows = self.grid(n)
+        x0, y0, x1, y1 = box
+        tx0 = max(0, int(x0 * sx) // self.tile)
+        ty0 = max(0, int(y0 * sy) // self.tile)
+        tx1 = min(cols - 1, int(math.ceil(x1 * sx) - 1) // self.tile)
+        ty1 = min(rows - 1, int(math.ceil(y1 * sy) - 1) // self.tile)
+        return [(tx, ty) for ty in range(ty0, ty1 + 1) for tx in range(tx0, tx1 + 1)]
+
+    def _scale(self, n: int) -> Tuple[float, float]:
+        w, h = self.size
+        lh, lw = self.level(n).shape[:2]
+        return lw / w, lh / h
+
+    def viewport(self, cx: float, cy: float, zoom: float, out_w: int, out_h: int) -> np.ndarray:
+        """Render an out_w x out_h view centred on level-0 point (cx, cy) at `zoom` display px per source px."""
+        w, h = self.size
+        vw, vh = out_w / zoom, out_h / zoom
+        x0 = min(max(cx - vw / 2, 0), max(w - vw, 0))
+        y0 = min(max(cy - vh / 2, 0), max(h - vh, 0))
+        x1, y1 = min(x0 + vw, w), min(y0 + vh, h)
+        n = self.level_for_zoom(zoom)
+        sx, sy = self._scale(n)
+        # Stitch only the overlapping tiles, then crop to the exact box
+        tiles = self.tiles_for(n, (x0, y0, x1, y1))
+        tx0, ty0 = tiles[0]
+        tx1, ty1 = tiles[-1]
+        rows = [np.hstack([self.get_tile(n, tx, ty) for tx in range(tx0, tx1 + 1)])
+                for ty in range(ty0, ty1 + 1)]
+        mosaic = np.vstack(rows)
+        ox, oy = tx0 * self.tile, ty0 * self.tile
+        crop = mosaic[int(y0 * sy) - oy:max(int(math.ceil(y1 * sy)) - oy, int(y0 * sy) - oy + 1),
+                      int(x0 * sx) - ox:max(int(math.ceil(x1 * sx)) - ox, int(x0 * sx) - ox + 1)]
+        dw = max(1, min(out_w, int(round((x1 - x0) * zoom))))
+        dh = max(1, min(out_h, int(round((y1 - y0) * zoom))))
+        interp = cv2.INTER_AREA if crop.shape[1] > dw else cv2.INTER_LINEAR
+        return cv2.resize(crop, (dw, dh), interpolation=interp)
+
+    def fit_zoom(self, out_w: int, out_h: int) -> float:
+        w, h = self.size
+        return min(1.0, out_w / w, out_h / h)
+
+
+_pyramids: Dict[str, TilePyramid] = {}
+
+
+def pyramid_for(key: str, img: np.ndarray, max_entries: int = 4) -> TilePyramid:
+    """Pyramid cached under a content key (e.g. a hash of the uploaded bytes), built on first use."""
+    pyr = _pyramids.pop(key, None)
+    if pyr is None:
+        pyr = TilePyramid(img)
+    _pyramids[key] = pyr
+    while len(_pyramids) > max_entries:
+        _pyramids.pop(next(iter(_pyramids)))
+    return pyr
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from pipeline import GEOMETRIC
+
+# ------------------------------
+# Content-addressed result store
+# ------------------------------
+# Batch outputs are stored under a key made of the input file's content
+# hash and a hash of the pipeline JSON, the output format and the library
+# versions. A re-run therefore recomputes only new or changed files, and
+# everything after an edited pipeline step. Optionally the store also
+# keeps the pixels at each step boundary, so editing the last step of a
+# long pipeline resumes from the stored prefix instead of the decoded
+# input. Objects are written to a temporary file and renamed into place,
+# so an interrupted run never leaves a truncated object. gc() trims the
+# store to a size limit, least recently used first (use refreshes mtime).
+
+STORE_VERSION = 2  # 2: outputs are copies; objects that were hard-linked to outputs are not trusted
+_LIBS = {"opencv": cv2.__version__, "numpy": np.__version__, "store": STORE_VERSION}
+
+
+def file_key(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def pipeline_key(steps: List[Dict[str, Any]], fmt: Optional[str] = None) -> str:
+    """Hash of the canonical steps JSON (+ output format) and the library versions."""
+    spec = json.dumps({"steps": [{"op": s["op"], "params": s.get("params", {})} for s in steps],
+                       "format": fmt, "libs": _LIBS}, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(spec.encode(), digest_size=20).hexdigest()
+
+
+def boundaries(steps: List[Dict[str, Any]]) -> List[int]:
+    """Prefix lengths the pipeline can be split at without changing its output.
+
+    run_pipeline resamples each run of consecutive geometric steps once, so a
+    split inside such a run is not allowed; everywhere else it is.
+    """
+    return [i for i in range(1, len(steps))
+            if not (steps[i - 1]["op"] in GEOMETRIC and steps[i]["op"] in GEOMETRIC)]
+
+
+class ResultStore:
+    def __init__(self, root: str):
+        self.root = root
+        self._objects = os.path.join(root, "objects")
+        self._tmp = os.path.join(root, "tmp")
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._tmp, exist_ok=True)
+        self._stat_path = os.path.join(root, "inputs.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self._stat_path) as f:
+                self._stats: Dict[str, List[Any]] = json.load(f)
+        except (OSError, ValueError):
+            self._stats = {}
+        self._stats_dirty = False
+
+    # --- keys ---
+    def input_key(self, path: str, data: Optional[bytes] = None) -> Tuple[str, Optional[bytes]]:
+        """(content key, bytes read); files unchanged since the last run (size, mtime) are not re-read."""
+        st = os.stat(path)
+        with self._lock:
+            known = self._stats.get(path)
+        if data is None and known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2], None
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        key = file_key(data)
+        with self._lock:
+            self._stats[path] = [st.st_size, st.st_mtime_ns, key]
+            self._stats_dirty = True
+        return key, data
+
+    def result_key(self, in_key: str, steps: List[Dict[str, Any]], fmt: str) -> str:
+        return f"{in_key}-{pipeline_key(steps, fmt)}"
+
+    def prefix_key(self, in_key: str, steps: List[Dict[str, Any]]) -> str:
+        return f"{in_key}-{pipeline_key(steps)}.npy"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._objects, key[:2], key)
+
+    # --- objects ---
+    def has(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def _touch(self, path: str):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._touch(path)
+        return data
+
+    def _write(self, key: str, write) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self._tmp)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        return self._write(key, lambda f: f.write(data))
+
+    def put_array(self, key: str, arr: np.ndarray) -> str:
+        return self._write(key, lambda f: np.save(f, np.ascontiguousarray(arr)))
+
+    def get_array(self, key: str) -> Optional[np.ndarray]:
+        path = self._path(key)
+        try:
+            arr = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        self._touch(path)
+        return arr
+
+    def export(self, key: str, dest: str):
+        """Copy the stored object to dest atomically.
+
+        A copy, not a hard link: whatever later writes the output (an editor, a
+        --no-store run) must not be able to write through into the store. The new
+        file gets the usual umask permissions rather than the store's private ones.
+        """
+        src = self._path(key)
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp = f"{dest}.tmp{os.getpid()}"
+        try:
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dest)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self._touch(src)
+
+    # --- housekeeping ---
+    def flush(self):
+        """Persist the input stat cache (atomically)."""
+        with self._lock:
+            if not self._stats_dirty:
+                return
+            stats = dict(self._stats)
+            self._stats_dirty = False
+        fd, tmp = tempfile.mkstemp(dir=self._tmp)
+        with os.fdopen(fd, "w") as f:
+            json.dump(stats, f)
+        os.replace(tmp, self._stat_path)
+
+    def size(self) -> Tuple[int, int]:
+        """(objects, bytes) currently stored."""
+        n = total = 0
+        for _, _, st in self._scan():
+            n += 1
+            total += st.st_size
+        return n, total
+
+    def _scan(self):
+        for d in os.scandir(self._objects):
+            if d.is_dir():
+                for e in os.scandir(d.path):
+                    if e.is_file():
+                        yield e.path, e.name, e.stat()
+
+    def gc(self, max_bytes: int, tmp_age: float = 3600.0) -> Tuple[int, int]:
+        """Delete least recently used objects until the store fits max_bytes; returns (files, bytes) freed.
+
+        Stat-cache entries for inputs that no longer exist are dropped too, and the cache is flushed.
+        """
+        objs = sorted(self._scan(), key=lambda o: o[2].st_mtime)
+        total = sum(st.st_size for _, _, st in objs)
+        freed = files = 0
+        for path, _, st in objs:
+            if total - freed <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            freed += st.st_size
+            files += 1
+        # Temporary files left behind by killed runs
+        now = time.time()
+        for e in os.scandir(self._tmp):
+            if now - e.stat().st_mtime > tmp_age:
+                try:
+                    os.remove(e.path)
+                except OSError:
+                    pass
+        with self._lock:
+            self._stats = {p: v for p, v in self._stats.items() if os.path.exists(p)}
+            self._stats_dirty = True
+        self.flush()
+        return files, freed
@@ -0,0 +1,302 @@
+"""Local HTTP image-processing service.
+
+    python server.py --port 8000
+
+GET  /ops                      list of operation names
+GET  /metrics                  latency / throughput / batching / cache counters
+POST /op/<name>?k=5&format=png raw encoded image in, encoded result out
+POST /pipeline                 JSON {"image_b64": ..., "steps": [...], "format": "png"}
+
+Query values are parsed as JSON when possible (k=5 -> 5, src_pts=[[0,0],...]).
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlparse
+import cv2
+import numpy as np
+from pipeline import OPS, run_pipeline
+
+FORMATS = {"png": ".png", "jpg": ".jpg", "jpeg": ".jpg", "webp": ".webp", "bmp": ".bmp"}
+
+# ------------------------------
+# Codec helpers
+# ------------------------------
+def decode(data: bytes) -> np.ndarray:
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+def encode(img: np.ndarray, fmt: str = "png") -> bytes:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    ok, buf = cv2.imencode(FORMATS[fmt], img)
+    if not ok:
+        raise ValueError(f"Could not encode as {fmt}")
+    return buf.tobytes()
+
+# ------------------------------
+# Decoded-input cache
+# ------------------------------
+class DecodeCache:
+    """Decoded RGB arrays keyed by a hash of the encoded bytes, bounded in bytes."""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, data: bytes) -> Tuple[str, np.ndarray]:
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        with self._lock:
+            img = self._items.get(digest)
+            if img is not None:
+                self.hits += 1
+                self._items.move_to_end(digest)
+                return digest, img
+            self.misses += 1
+        img = decode(data)
+        img.flags.writeable = False  # shared between requests
+        with self._lock:
+            if digest not in self._items:
+                self._items[digest] = img
+                self._bytes += img.nbytes
+                while self._bytes > self.max_bytes and len(self._items) > 1:
+                    _, old = self._items.popitem(last=False)
+                    self._bytes -= old.nbytes
+        return digest, img
+
+# ------------------------------
+# Metrics
+# ------------------------------
+class Metrics:
+    def __init__(self, window: int = 2048):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.latency = defaultdict(lambda: deque(maxlen=window))
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.computed = 0
+
+    def record(self, route: str, seconds: float, n_in: int, n_out: int, ok: bool):
+        with self._lock:
+            self.requests[route] += 1
+            if not ok:
+                self.errors[route] += 1
+            self.latency[route].append(seconds)
+            self.bytes_in += n_in
+            self.bytes_out += n_out
+
+    def record_batch(self, size: int, unique: int):
+        with self._lock:
+            self.batches += 1
+            self.batched_requests += size
+            self.computed += unique
+
+    def snapshot(self, cache: DecodeCache) -> Dict[str, Any]:
+        with self._lock:
+            uptime = time.time() - self.started
+            routes = {}
+            for route, lat in self.latency.items():
+                arr = np.array(lat) * 1000
+                routes[route] = {
+                    "requests": self.requests[route],
+                    "errors": self.errors[route],
+                    "rps": round(self.requests[route] / max(uptime, 1e-9), 2),
+                    "latency_ms": {"mean": round(float(arr.mean()), 2),
+                                   "p50": round(float(np.percentile(arr, 50)), 2),
+                                   "p95": round(float(np.percentile(arr, 95)), 2),
+                                   "max": round(float(arr.max()), 2)},
+                }
+            return {
+                "uptime_s": round(uptime, 1),
+                "routes": routes,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "batches": self.batches,
+                "mean_batch_size": round(self.batched_requests / max(self.batches, 1), 2),
+                "dedup_saved": self.batched_requests - self.computed,
+                "decode_cache": {"hits": cache.hits, "misses": cache.misses},
+            }
+
+# ------------------------------
+# Micro-batching
+# ------------------------------
+class MicroBatcher:
+    """Collects requests per operation for a few ms, then runs each batch on the pool.
+
+    Requests in a batch with the same input hash and steps are computed once
+    and the result fanned out to all of them; the distinct computations of a
+    batch are separate pool tasks, so they run side by side.
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor, metrics: Metrics, max_batch: int = 16, max_wait: float = 0.005):
+        self.pool = pool
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queues: Dict[str, List[tuple]] = defaultdict(list)
+        self._cond = threading.Condition()
+        threading.Thread(target=self._dispatch, name="batcher", daemon=True).start()
+
+    def submit(self, op_key: str, digest: str, img: np.ndarray, steps: List[Dict[str, Any]]) -> Future:
+        fut = Future()
+        with self._cond:
+            self._queues[op_key].append((digest, img, steps, fut))
+            self._cond.notify()
+        return fut
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not any(self._queues.values()):
+                    self._cond.wait()
+            time.sleep(self.max_wait)  # let concurrent requests of the same op join
+            with self._cond:
+                queues, self._queues = self._queues, defaultdict(list)
+            for items in queues.values():
+                for i in range(0, len(items), self.max_batch):
+                    for members in self._group(items[i:i + self.max_batch]):
+                        self.pool.submit(self._run_group, members)
+
+    def _group(self, items: List[tuple]) -> List[List[tuple]]:
+        groups: Dict[Tuple[str, str], List[tuple]] = {}
+        for item in items:
+            groups.setdefault((item[0], json.dumps(item[2], sort_keys=True)), []).append(item)
+        self.metrics.record_batch(len(items), len(groups))
+        return list(groups.values())
+
+    def _run_group(self, members: List[tuple]):
+        _, img, steps, _ = members[0]
+        try:
+            result = run_pipeline(img, steps)
+        except BaseException as exc:
+            for m in members:
+                m[3].set_exception(exc)
+            return
+        for m in members:
+            m[3].set_result(result)
+
+# ------------------------------
+# HTTP
+# ------------------------------
+def _parse_value(v: str) -> Any:
+    try:
+        return json.loads(v)
+    except ValueError:
+        return v
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    cache: DecodeCache = None
+    metrics: Metrics = None
+    batcher: MicroBatcher = None
+
+    def log_message(self, fmt, *args):
+        pass  # counters live in /metrics
+
+    def _send(self, code: int, body: bytes, ctype: str):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, code: int, obj: Any):
+        self._send(code, json.dumps(obj).encode(), "application/json")
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/ops":
+            self._json(200, sorted(OPS))
+        elif path == "/metrics":
+            self._json(200, self.metrics.snapshot(self.cache))
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        t0 = time.perf_counter()
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        route = url.path if not url.path.startswith("/op/") else "/op/" + url.path[4:]
+        out = b""
+        ok = False
+        try:
+            if url.path.startswith("/op/"):
+                name = url.path[4:]
+                if name not in OPS:
+                    raise KeyError(name)
+                query = dict(parse_qsl(url.query))
+                fmt = query.pop("format", "png")
+                steps = [{"op": name, "params": {k: _parse_value(v) for k, v in query.items()}}]
+                data, op_key = body, name
+            elif url.path == "/pipeline":
+                req = json.loads(body)
+                steps, fmt = req["steps"], req.get("format", "png")
+                data = base64.b64decode(req["image_b64"])
+                op_key = "pipeline:" + ",".join(s["op"] for s in steps)
+            else:
+                self._json(404, {"error": "not found"})
+                return
+            digest, img = self.cache.get(data)
+            result = self.batcher.submit(op_key, digest, img, steps).result()
+            out = encode(result, fmt)
+            ok = True
+            self._send(200, out, "image/" + FORMATS[fmt].strip("."))
+        except KeyError as exc:
+            self._json(404, {"error": f"unknown operation or field: {exc}"})
+        except (ValueError, TypeError, cv2.error) as exc:
+            self._json(400, {"error": str(exc)})
+        except Exception as exc:
+            self._json(500, {"error": f"{type(exc).__name__}: {exc}"})
+        finally:
+            self.metrics.record(route, time.perf_counter() - t0, len(body), len(out), ok)
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default of 5 makes bursts wait on SYN retries
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8000, workers: int = None,
+                max_batch: int = 16, max_wait_ms: float = 5.0) -> "Server":
+    pool = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1), thread_name_prefix="worker")
+    Handler.cache = DecodeCache()
+    Handler.metrics = Metrics()
+    Handler.batcher = MicroBatcher(pool, Handler.metrics, max_batch, max_wait_ms / 1000.0)
+    return Server((host, port), Handler)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Image Processing Toolkit HTTP service")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--max-batch", type=int, default=16)
+    ap.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = ap.parse_args()
+    server = make_server(args.host, args.port, args.workers, args.max_batch, args.max_wait_ms)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
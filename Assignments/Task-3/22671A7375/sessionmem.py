@@ -0,0 +1,253 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+import numpy as np
+from typing import Dict, Optional
+from imagebuf import freeze
+
+# ------------------------------
+# Per-session memory budget
+# ------------------------------
+# When one server hosts a whole class, every session's full-resolution
+# arrays add up. Sessions keep those arrays in a SessionMemory instead of
+# holding them directly. The process-wide MemoryManager counts the bytes
+# each session and the process keep resident. Above the ceiling it spills
+# the least recently used arrays to disk, and after `idle_seconds` without
+# access it spills a session's arrays entirely. A spilled array is read
+# back only when it is next asked for. Arrays are stored read-only, so
+# spilling one that already has a file on disk only drops the reference.
+
+DEFAULT_LIMIT_MB = int(os.environ.get("TOOLKIT_MEM_LIMIT_MB", "1024"))
+DEFAULT_IDLE_SECONDS = float(os.environ.get("TOOLKIT_MEM_IDLE_SECONDS", "300"))
+
+
+class _Entry:
+    __slots__ = ("array", "path", "nbytes", "last_used", "ref")
+
+    def __init__(self, array: np.ndarray, borrowed: bool = False):
+        # A borrowed array is owned (and bounded) by someone else, e.g. the shared cache:
+        # only a weak reference is kept, it is not counted and never spilled
+        self.ref = weakref.ref(array) if borrowed else None
+        self.array: Optional[np.ndarray] = None if borrowed else array
+        self.path: Optional[str] = None
+        self.nbytes = 0 if borrowed else array.nbytes
+        self.last_used = time.monotonic()
+
+
+class MemoryManager:
+    def __init__(self, limit_bytes: int, spill_dir: Optional[str] = None,
+                 idle_seconds: float = DEFAULT_IDLE_SECONDS, session_limit_bytes: Optional[int] = None,
+                 compress: bool = False):
+        self.limit_bytes = limit_bytes
+        self.session_limit_bytes = session_limit_bytes
+        self.idle_seconds = idle_seconds
+        self.compress = compress  # .npz (zlib) instead of plain .npy read back memory-mapped
+        self._own_dir = spill_dir is None
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="toolkit-spill-")
+        self._lock = threading.RLock()
+        self._sessions: Dict[str, Dict[str, _Entry]] = {}
+        self._last_seen: Dict[str, float] = {}
+        self._last_idle_check = 0.0
+        self.resident_bytes = 0
+        self.counters = {"spills": 0, "spilled_bytes_written": 0, "reloads": 0, "idle_sessions_spilled": 0,
+                         "sessions_dropped": 0}
+
+    # --- sessions ---
+    def session(self, session_id: Optional[str] = None) -> "SessionMemory":
+        """Handle for one session; its arrays are dropped when the handle is garbage-collected."""
+        sid = session_id or uuid.uuid4().hex
+        with self._lock:
+            self._sessions.setdefault(sid, {})
+            self._last_seen[sid] = time.monotonic()
+        return SessionMemory(self, sid)
+
+    def drop_session(self, sid: str):
+        with self._lock:
+            entries = self._sessions.pop(sid, None)
+            self._last_seen.pop(sid, None)
+            if entries is None:
+                return
+            for e in entries.values():
+                self._forget(e)
+            self.counters["sessions_dropped"] += 1
+        shutil.rmtree(os.path.join(self.spill_dir, sid), ignore_errors=True)
+
+    # --- entries ---
+    def put(self, sid: str, name: str, array: np.ndarray, borrowed: bool = False):
+        entry = _Entry(freeze(array), borrowed)
+        with self._lock:
+            entries = self._sessions.setdefault(sid, {})
+            old = entries.pop(name, None)
+            if old is not None:
+                self._forget(old)
+            entries[name] = entry
+            self.resident_bytes += entry.nbytes
+            self._touch(sid, entry)
+            self._enforce(sid, entry)
+
+    def get(self, sid: str, name: str) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._sessions.get(sid, {}).get(name)
+            if entry is None:
+                return None
+            if entry.ref is not None:
+                array = entry.ref()
+                if array is None:  # its owner let it go
+                    del self._sessions[sid][name]
+                else:
+                    self._touch(sid, entry)
+                return array
+            if entry.array is None:
+                entry.array = freeze(self._load(entry.path))
+                self.resident_bytes += entry.nbytes
+                self.counters["reloads"] += 1
+            self._touch(sid, entry)
+            array = entry.array
+            self._enforce(sid, entry)
+            return array
+
+    def discard(self, sid: str, name: str):
+        with self._lock:
+            entry = self._sessions.get(sid, {}).pop(name, None)
+            if entry is not None:
+                self._forget(entry)
+
+    def _touch(self, sid: str, entry: _Entry):
+        entry.last_used = self._last_seen[sid] = time.monotonic()
+
+    def _forget(self, entry: _Entry):
+        if entry.array is not None:
+            self.resident_bytes -= entry.nbytes
+            entry.array = None
+        if entry.path is not None:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+            entry.path = None
+
+    # --- spilling ---
+    def _load(self, path: str) -> np.ndarray:
+        if path.endswith(".npz"):
+            with np.load(path) as z:
+                return z["a"]
+        return np.load(path, mmap_mode="r")
+
+    def _spill(self, sid: str, name: str, entry: _Entry):
+        if entry.array is None:
+            return
+        if entry.path is None:
+            d = os.path.join(self.spill_dir, sid)
+            os.makedirs(d, exist_ok=True)
+            path = os.path.join(d, f"{uuid.uuid4().hex}.{'npz' if self.compress else 'npy'}")
+            if self.compress:
+                np.savez_compressed(path, a=entry.array)
+            else:
+                np.save(path, np.ascontiguousarray(entry.array))
+            entry.path = path
+            self.counters["spilled_bytes_written"] += entry.nbytes
+        entry.array = None
+        self.resident_bytes -= entry.nbytes
+        self.counters["spills"] += 1
+
+    def _enforce(self, sid: str, keep: _Entry):
+        now = time.monotonic()
+        if now - self._last_idle_check > min(self.idle_seconds, 30.0):
+            self._last_idle_check = now
+            for other, seen in list(self._last_seen.items()):
+                if other != sid and now - seen > self.idle_seconds and self.session_bytes(other) > 0:
+                    for name, e in self._sessions[other].items():
+                        self._spill(other, name, e)
+                    self.counters["idle_sessions_spilled"] += 1
+        if self.session_limit_bytes is not None:
+            own = self._sessions.get(sid, {})
+            for name, e in sorted(own.items(), key=lambda kv: kv[1].last_used):
+                if self.session_bytes(sid) <= self.session_limit_bytes:
+                    break
+                if e is not keep:
+                    self._spill(sid, name, e)
+        if self.resident_bytes > self.limit_bytes:
+            # Least recently used first across all sessions; the entry being used stays
+            candidates = sorted(((e.last_used, s, n, e) for s, es in self._sessions.items()
+                                 for n, e in es.items() if e.array is not None and e is not keep),
+                                key=lambda c: c[0])
+            for _, s, n, e in candidates:
+                if self.resident_bytes <= self.limit_bytes:
+                    break
+                self._spill(s, n, e)
+
+    def spill_idle(self):
+        """Spill every session idle for longer than idle_seconds (also done opportunistically)."""
+        with self._lock:
+            self._last_idle_check = 0.0
+            self._enforce("", None)
+
+    # --- metrics ---
+    def session_bytes(self, sid: str) -> int:
+        with self._lock:
+            return sum(e.nbytes for e in self._sessions.get(sid, {}).values() if e.array is not None)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            spilled = sum(e.nbytes for es in self._sessions.values() for e in es.values() if e.array is None)
+            return {
+                "limit_bytes": self.limit_bytes,
+                "resident_bytes": self.resident_bytes,
+                "spilled_bytes": spilled,
+                "sessions": len(self._sessions),
+                "per_session_bytes": {s: self.session_bytes(s) for s in self._sessions},
+                **self.counters,
+            }
+
+    def close(self):
+        with self._lock:
+            for sid in list(self._sessions):
+                self.drop_session(sid)
+        if self._own_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+class SessionMemory:
+    """One session's named arrays, accounted against (and spilled by) a MemoryManager."""
+
+    def __init__(self, manager: MemoryManager, session_id: str):
+        self.manager = manager
+        self.session_id = session_id
+        self._finalizer = weakref.finalize(self, manager.drop_session, session_id)
+
+    def put(self, name: str, array: np.ndarray, borrowed: bool = False):
+        """Keep array under name; borrowed=True for arrays another cache owns (weakly held, not counted)."""
+        self.manager.put(self.session_id, name, array, borrowed)
+
+    def get(self, name: str) -> Optional[np.ndarray]:
+        """The array (read back from disk if it was spilled), or None."""
+        return self.manager.get(self.session_id, name)
+
+    def discard(self, name: str):
+        self.manager.discard(self.session_id, name)
+
+    @property
+    def nbytes(self) -> int:
+        return self.manager.session_bytes(self.session_id)
+
+    def close(self):
+        self._finalizer()
+
+
+_manager: Optional[MemoryManager] = None
+_manager_lock = threading.Lock()
+
+
+def memory_manager() -> MemoryManager:
+    """Process-wide manager (ceiling from TOOLKIT_MEM_LIMIT_MB), cleaned up at exit."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = MemoryManager(DEFAULT_LIMIT_MB << 20)
+            atexit.register(_manager.close)
+        return _manager
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import threading
+import weakref
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional
+from colorimage import ColorImage, decode_rgb
+from imagebuf import freeze
+from jobs import Cancelled, CancelToken, run_step
+
+# ------------------------------
+# Cross-session content-addressed cache
+# ------------------------------
+# In a classroom deployment many sessions upload the same file and run the
+# same operations on it. This cache is shared by every session in the
+# process and is keyed by content: the hash of the encoded upload for a
+# decoded image, and that hash plus the canonical step JSON for a result.
+# A key is computed once however many sessions ask for it at the same time:
+# the first caller computes and the others wait for its result. If the
+# computation was cancelled, a waiter takes over. Entries that a session
+# holds a reference to are never evicted. The rest are dropped least
+# recently used first once the cache is over its byte limit.
+
+DEFAULT_LIMIT_MB = int(os.environ.get("TOOLKIT_SHARED_CACHE_MB", "512"))
+
+
+def _sizeof(value: Any) -> int:
+    return int(getattr(value, "nbytes", 0))
+
+
+class _Entry:
+    __slots__ = ("value", "nbytes", "refs")
+
+    def __init__(self, value: Any):
+        self.value = value
+        self.nbytes = _sizeof(value)
+        self.refs = 0
+
+
+class SharedCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "waits": 0, "evictions": 0, "takeovers": 0}
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], token: Optional[CancelToken] = None,
+                       acquire: bool = False) -> Any:
+        """Cached value for key; concurrent misses on one key run compute() once.
+
+        With acquire=True the entry is pinned until release(key) is called.
+        A waiter checks its own token while it waits.
+        """
+        while True:
+            with self._lock:
+                entry = self._items.get(key)
+                if entry is not None:
+                    self.counters["hits"] += 1
+                    self._items.move_to_end(key)
+                    self._remeasure(entry)
+                    if acquire:
+                        entry.refs += 1
+                    return entry.value
+                fut = self._inflight.get(key)
+                leader = fut is None
+                if leader:
+                    fut = self._inflight[key] = Future()
+                    self.counters["misses"] += 1
+                else:
+                    self.counters["waits"] += 1
+            if leader:
+                return self._lead(key, fut, compute, acquire)
+            try:
+                while True:
+                    if token is not None:
+                        token.check()
+                    try:
+                        fut.result(timeout=0.1)
+                        break
+                    except FutureTimeout:
+                        continue
+            except Cancelled:
+                if token is not None and token.cancelled:
+                    raise
+                with self._lock:
+                    self.counters["takeovers"] += 1
+                continue  # the leader was cancelled, not us: compute it ourselves
+            # Loop round to pick the entry up (and pin it) under the lock
+
+    def _lead(self, key: str, fut: Future, compute: Callable[[], Any], acquire: bool) -> Any:
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            fut.set_exception(e)
+            raise
+        entry = _Entry(value)
+        if acquire:
+            entry.refs = 1
+        with self._lock:
+            del self._inflight[key]
+            if value is not None:
+                self._items[key] = entry
+                self._bytes += entry.nbytes
+                self._evict()
+        fut.set_result(None)
+        return value
+
+    def release(self, key: str):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+                self._evict()
+
+    def _remeasure(self, entry: _Entry):
+        # Values such as ColorImage grow as their conversions are memoized
+        n = _sizeof(entry.value)
+        self._bytes += n - entry.nbytes
+        entry.nbytes = n
+
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            return
+        for key in [k for k, e in self._items.items() if e.refs == 0]:
+            if self._bytes <= self.max_bytes:
+                break
+            self._bytes -= self._items.pop(key).nbytes
+            self.counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pinned = sum(e.nbytes for e in self._items.values() if e.refs)
+            return {"entries": len(self._items), "bytes": self._bytes, "pinned_bytes": pinned,
+                    "max_bytes": self.max_bytes, "inflight": len(self._inflight), **self.counters}
+
+
+class CacheRefs:
+    """The cache entries one session holds, one per named slot; all released when it is garbage-collected."""
+
+    def __init__(self, cache: SharedCache):
+        self.cache = cache
+        self._held: Dict[str, str] = {}
+        self._finalizer = weakref.finalize(self, CacheRefs._release_all, cache, self._held)
+
+    @staticmethod
+    def _release_all(cache: SharedCache, held: Dict[str, str]):
+        for key in held.values():
+            cache.release(key)
+        held.clear()
+
+    def hold(self, slot: str, key: str, compute: Callable[[], Any]) -> Any:
+        """Value for key, pinned for this session in `slot` (releasing what the slot held before)."""
+        if self._held.get(slot) == key:
+            return self.cache.get_or_compute(key, compute)
+        value = self.cache.get_or_compute(key, compute, acquire=True)
+        old = self._held.pop(slot, None)
+        if old is not None:
+            self.cache.release(old)
+        if value is not None:
+            self._held[slot] = key
+        return value
+
+    def close(self):
+        self._finalizer()
+
+
+_cache: Optional[SharedCache] = None
+_cache_lock = threading.Lock()
+
+
+def shared_cache() -> SharedCache:
+    """Process-wide cache (limit from TOOLKIT_SHARED_CACHE_MB)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SharedCache(DEFAULT_LIMIT_MB << 20)
+        return _cache
+
+
+# ------------------------------
+# Keys and helpers
+# ------------------------------
+def bytes_key(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def step_key(src_key: str, op: str, params: Dict[str, Any]) -> str:
+    """Key of a result: input content key + canonical JSON of the step."""
+    spec = json.dumps({"op": op, "params": params}, sort_keys=True, default=repr)
+    return hashlib.blake2b(f"{src_key}|{spec}".encode(), digest_size=16).hexdigest()
+
+
+def decoded(data: bytes, refs: Optional[CacheRefs] = None, key: Optional[str] = None,
+            load: Optional[Callable[[], Optional[ColorImage]]] = None) -> Optional[ColorImage]:
+    """The upload decoded once per process as a ColorImage (pinned in refs' "original" slot if given).
+
+    `load` replaces the plain decode on a miss, e.g. to reuse an image a gallery still holds.
+    """
+    key = key or bytes_key(data)
+    compute = load or (lambda: _load(data, key))
+    if refs is not None:
+        return refs.hold("original", f"img:{key}", compute)
+    return shared_cache().get_or_compute(f"img:{key}", compute)
+
+
+def _load(data: bytes, key: str) -> Optional[ColorImage]:
+    rgb = decode_rgb(data)
+    return None if rgb is None else ColorImage(rgb, "RGB", key=key)
+
+
+def cached_step(src_key: str, img: np.ndarray, op: str, params: Dict[str, Any],
+                token: Optional[CancelToken] = None) -> np.ndarray:
+    """run_step through the shared cache, so sessions running the same step on the same input share it."""
+    key = f"res:{step_key(src_key, op, params)}"
+    return shared_cache().get_or_compute(key, lambda: freeze(run_step(img, op, params, token)), token)
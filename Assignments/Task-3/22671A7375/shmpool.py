@@ -0,0 +1,229 @@
+import atexit
+import os
+import threading
+import numpy as np
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from pipeline import run_pipeline
+
+# ------------------------------
+# Shared-memory worker pool
+# ------------------------------
+# ProcessPoolExecutor pickles every argument and result, so a 24 MP RGB frame
+# (72 MB) is copied through a pipe on the way in and again on the way out.
+# Here frames live in shared-memory segments owned by the parent and recycled
+# between tasks; a task message is only (segment names, shape, dtype, steps),
+# and workers map the same pages instead of receiving bytes.
+
+_MB = 1 << 20
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Attaching must not register the segment with the resource tracker: the
+    # parent owns (and unlinks) it, and a second registration makes the
+    # tracker unlink it early or warn about leaks (fixed by track=False in 3.13)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+# Per-worker cache of attached segments; recycled segments keep their names
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _forget(live: FrozenSet[str]):
+    # Drop mappings of segments the parent has unlinked since this worker's last task
+    for name in [n for n in _attached if n not in live]:
+        try:
+            _attached[name].close()
+        except BufferError:
+            continue  # still viewed; retried on the next task
+        del _attached[name]
+
+
+def _view(name: str, shape: Tuple[int, ...], dtype: str) -> np.ndarray:
+    shm = _attached.get(name)
+    if shm is None:
+        shm = _attached[name] = _attach(name)
+    return np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+
+
+def _worker(src: Tuple[str, tuple, str], dst: Tuple[str, int], steps: List[Dict[str, Any]],
+            live: FrozenSet[str] = None):
+    if live is not None:
+        _forget(live)
+    img = _view(*src)
+    res = np.ascontiguousarray(run_pipeline(img, steps))
+    if res.nbytes > dst[1]:
+        return res.shape, res.dtype.str, res  # does not fit (e.g. upscaling): fall back to pickling
+    _view(dst[0], res.shape, res.dtype.str)[...] = res
+    return res.shape, res.dtype.str, None
+
+
+class SegmentPool:
+    """Shared-memory segments recycled by size class (whole MiB)."""
+
+    def __init__(self, max_free_bytes: int = 1 << 30):
+        self.max_free_bytes = max_free_bytes
+        self._free: Dict[int, List[shared_memory.SharedMemory]] = {}
+        self._free_bytes = 0
+        self._all: Dict[str, shared_memory.SharedMemory] = {}
+        self._unclosed: List[shared_memory.SharedMemory] = []  # unlinked, but a view was still alive
+        self._lock = threading.Lock()
+
+    def acquire(self, nbytes: int) -> shared_memory.SharedMemory:
+        size = max(1, -(-nbytes // _MB)) * _MB
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                self._free_bytes -= size
+                return free.pop()
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        with self._lock:
+            self._all[shm.name] = shm
+        return shm
+
+    def release(self, shm: shared_memory.SharedMemory):
+        with self._lock:
+            if self._free_bytes + shm.size <= self.max_free_bytes:
+                self._free.setdefault(shm.size, []).append(shm)
+                self._free_bytes += shm.size
+                return
+            self._all.pop(shm.name, None)
+        self._discard(shm)
+
+    def _discard(self, shm: shared_memory.SharedMemory):
+        # Unlink first so the name is gone even if close() has to wait for a view to die
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            pending, self._unclosed = self._unclosed + [shm], []
+        for seg in pending:
+            try:
+                seg.close()
+            except BufferError:
+                with self._lock:
+                    self._unclosed.append(seg)
+
+    def names(self) -> FrozenSet[str]:
+        """Names of the segments this pool currently owns (workers drop attachments to any other)."""
+        with self._lock:
+            return frozenset(self._all)
+
+    def close(self):
+        with self._lock:
+            segs, self._all, self._free, self._free_bytes = list(self._all.values()), {}, {}, 0
+            segs, self._unclosed = segs + self._unclosed, []
+        for shm in segs:
+            try:
+                shm.close()
+                shm.unlink()
+            except (BufferError, FileNotFoundError):
+                pass
+
+
+class Lease:
+    """Result frame still living in its shared segment; release() returns the segment to the pool."""
+
+    def __init__(self, pool: SegmentPool, shm: Optional[shared_memory.SharedMemory], array: np.ndarray):
+        self._pool = pool
+        self._shm = shm
+        self.array = array
+
+    def release(self):
+        if self._shm is not None:
+            self.array = None
+            self._pool.release(self._shm)
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SharedMemoryPool:
+    def __init__(self, workers: Optional[int] = None, max_free_bytes: int = 1 << 30):
+        self.segments = SegmentPool(max_free_bytes)
+        self._executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+
+    def frame(self, shape: Tuple[int, ...], dtype=np.uint8) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+        """A writable array backed by a pooled segment, for producers that can fill it in place
+        (e.g. ``cv2.cvtColor(decoded, code, dst=arr)``); pass the segment to submit_frame."""
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        shm = self.segments.acquire(nbytes)
+        return shm, np.ndarray(shape, dtype, buffer=shm.buf)
+
+    def submit(self, img: np.ndarray, steps: List[Dict[str, Any]]) -> Future:
+        shm, arr = self.frame(img.shape, img.dtype)
+        arr[...] = img
+        return self.submit_frame(shm, arr, steps)
+
+    def submit_frame(self, shm: shared_memory.SharedMemory, arr: np.ndarray,
+                     steps: List[Dict[str, Any]]) -> Future:
+        """Run steps on a frame already in a pooled segment; resolves to a Lease on the output."""
+        out = self.segments.acquire(arr.nbytes)
+        fut = Future()
+        inner = self._executor.submit(_worker, (shm.name, arr.shape, arr.dtype.str), (out.name, out.size), steps,
+                                      self.segments.names())
+
+        def done(f):
+            # Whatever happens here, the outer future must resolve or the caller waits forever
+            try:
+                self.segments.release(shm)
+                shape, dtype, pickled = f.result()
+                if pickled is None:
+                    fut.set_result(Lease(self.segments, out, np.ndarray(shape, np.dtype(dtype), buffer=out.buf)))
+                    return
+                result = Lease(self.segments, None, pickled)
+            except BaseException as exc:
+                result = exc
+            try:
+                self.segments.release(out)
+            finally:
+                if isinstance(result, Lease):
+                    fut.set_result(result)
+                else:
+                    fut.set_exception(result)
+
+        inner.add_done_callback(done)
+        return fut
+
+    def process(self, img: np.ndarray, steps: List[Dict[str, Any]]) -> np.ndarray:
+        """Blocking helper that copies the result out of shared memory."""
+        with self.submit(img, steps).result() as lease:
+            return lease.array.copy()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.segments.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_shared_pool: Optional[SharedMemoryPool] = None
+_shared_lock = threading.Lock()
+
+
+def shared_pool(workers: Optional[int] = None) -> SharedMemoryPool:
+    """Process-wide pool (e.g. for the app's video mode), closed at interpreter exit."""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = SharedMemoryPool(workers)
+            atexit.register(_shared_pool.close)
+        return _shared_pool
@@ -0,0 +1,73 @@
+import itertools
+import os
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Container, Dict, Iterator, List, Sequence, Tuple
+from pipeline import apply_step
+
+# ------------------------------
+# Parameter sweeps (contact sheet)
+# ------------------------------
+# Every combination of one or two parameter ranges is run on a small proxy of
+# the image on a thread pool (OpenCV releases the GIL) and yielded as soon as
+# it finishes, so the grid fills in progressively.
+
+# label -> (pipeline op, fixed params, {param: (min, max, step)})
+SWEEPS = {
+    "Mean filter": ("mean_filter", {}, {"k": (3, 31, 2)}),
+    "Gaussian filter": ("gaussian_filter", {}, {"k": (3, 31, 2), "sigma": (0.0, 10.0, 0.5)}),
+    "Median filter": ("median_filter", {}, {"k": (3, 31, 2)}),
+    "Canny": ("canny_edges", {}, {"t1": (0, 255, 5), "t2": (0, 255, 5)}),
+    "Dilation": ("morphology", {"op": "dilate"}, {"k": (3, 31, 2), "iterations": (1, 5, 1)}),
+    "Erosion": ("morphology", {"op": "erode"}, {"k": (3, 31, 2), "iterations": (1, 5, 1)}),
+    "Opening": ("morphology", {"op": "open"}, {"k": (3, 31, 2), "iterations": (1, 5, 1)}),
+    "Closing": ("morphology", {"op": "close"}, {"k": (3, 31, 2), "iterations": (1, 5, 1)}),
+    "Sharpening": ("sharpen", {}, {"amount": (0.0, 3.0, 0.1)}),
+    "Contrast stretch": ("contrast_stretch", {}, {"low_perc": (0, 10, 1), "high_perc": (90, 100, 1)}),
+    "JPEG quality": ("jpeg_roundtrip", {}, {"quality": (5, 100, 5)}),
+}
+
+
+def proxy(img: np.ndarray, max_side: int = 512) -> np.ndarray:
+    h, w = img.shape[:2]
+    s = max_side / max(h, w)
+    if s >= 1:
+        return img
+    return cv2.resize(img, (max(1, round(w * s)), max(1, round(h * s))), interpolation=cv2.INTER_AREA)
+
+
+def axis_values(spec: Tuple[float, float, float], lo: float, hi: float, n: int) -> List[Any]:
+    """n values from lo to hi snapped to the parameter's step (ints stay ints)."""
+    vmin, vmax, step = spec
+    vals = np.linspace(lo, hi, max(1, n))
+    vals = np.clip(np.round((vals - vmin) / step) * step + vmin, vmin, vmax)
+    if all(isinstance(v, int) for v in spec):
+        return sorted(set(int(v) for v in vals))
+    return sorted(set(round(float(v), 6) for v in vals))
+
+
+def combinations(axes: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    names = list(axes)
+    return [dict(zip(names, vals)) for vals in itertools.product(*(axes[n] for n in names))]
+
+
+def run_sweep(img: np.ndarray, op: str, fixed: Dict[str, Any], axes: Dict[str, Sequence[Any]],
+              max_workers: int = None, skip: Container[int] = ()) -> Iterator[Tuple[int, Dict[str, Any], np.ndarray]]:
+    """Yield (grid index, params, result) for every combination, in completion order.
+
+    Indices in `skip` (e.g. cells a previous, interrupted run already produced) are not run.
+    Closing the generator early cancels the combinations that have not started.
+    """
+    combos = combinations(axes)
+    workers = max_workers or min(8, os.cpu_count() or 1)
+    ex = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sweep")
+    try:
+        futures = {ex.submit(apply_step, img, op, {**fixed, **p}): (i, p)
+                   for i, p in enumerate(combos) if i not in skip}
+        for fut in as_completed(futures):
+            i, p = futures[fut]
+            yield i, p, fut.result()
+    finally:
+        # A rerun abandons the generator mid-sweep: drop the cells not started yet, don't wait
+        ex.shutdown(wait=False, cancel_futures=True)
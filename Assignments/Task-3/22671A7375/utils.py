@@ -2,6 +2,9 @@
 import cv2
 import numpy as np
 from typing import Tuple, Dict, Any, Optional
+from morph import morph
+from histogram import channel_histograms, equalize_lut, percentile
+from probe import probe_bytes
 
 # ------------------------------
 # Image Info
@@ -21,8 +24,12 @@ def get_image_info(img: np.ndarray, source_bytes: Optional[bytes] = None, file_e
         "file_format": fmt,
         "file_size_bytes": file_size,
         "file_size_kb": round(file_size/1024, 2) if file_size is not None else None,
-        "dpi_ppi": None  # OpenCV does not store DPI; usually part of metadata
+        "dpi_ppi": None  # OpenCV does not store DPI; read from the file header when we have it
     }
+    if source_bytes is not None:
+        header = probe_bytes(source_bytes)
+        if header is not None:
+            info["dpi_ppi"] = header["dpi"]
     return info
 
 # ------------------------------
@@ -132,44 +139,46 @@ def canny_edges(img_gray: np.ndarray, t1: int, t2: int) -> np.ndarray:
 # ------------------------------
 # Morphology
 # ------------------------------
-def morphology(img: np.ndarray, op: str, k: int, iterations: int = 1) -> np.ndarray:
-    kernel = np.ones((k, k), np.uint8)
-    if op == "dilate":
-        return cv2.dilate(img, kernel, iterations=iterations)
-    elif op == "erode":
-        return cv2.erode(img, kernel, iterations=iterations)
-    elif op == "open":
-        return cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel, iterations=iterations)
-    elif op == "close":
-        return cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel, iterations=iterations)
-    else:
-        return img
+def morphology(img: np.ndarray, op: str, k: int, iterations: int = 1, shape: str = "rect") -> np.ndarray:
+    return morph(img, op, k, iterations, shape)
 
 # ------------------------------
 # Enhancement
 # ------------------------------
-def histogram_equalization(img: np.ndarray) -> np.ndarray:
+def histogram_equalization(img: np.ndarray, hist: Optional[np.ndarray] = None) -> np.ndarray:
+    # hist: cached 256-bin histogram of the gray/Y channel, if the caller has one
     if len(img.shape) == 2:
-        return cv2.equalizeHist(img)
+        return cv2.equalizeHist(img) if hist is None else cv2.LUT(img, equalize_lut(hist))
     else:
         # Convert to YCrCb and equalize Y channel
         ycrcb = cv2.cvtColor(img, cv2.COLOR_RGB2YCrCb)
-        ycrcb[:,:,0] = cv2.equalizeHist(ycrcb[:,:,0])
+        y = ycrcb[:,:,0]
+        ycrcb[:,:,0] = cv2.equalizeHist(y) if hist is None else cv2.LUT(y, equalize_lut(hist))
         return cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2RGB)
 
-def contrast_stretch(img: np.ndarray, low_perc=2, high_perc=98) -> np.ndarray:
-    # percentile-based stretching
-    if len(img.shape) == 2:
-        lo, hi = np.percentile(img, (low_perc, high_perc))
-        out = (img - lo) * (255.0/(hi - lo + 1e-6))
-        return np.clip(out, 0, 255).astype(np.uint8)
-    else:
-        out = np.zeros_like(img)
-        for c in range(3):
+def contrast_stretch(img: np.ndarray, low_perc=2, high_perc=98, hists: Optional[np.ndarray] = None) -> np.ndarray:
+    # percentile-based stretching; for 8-bit input the percentiles come from per-channel
+    # histograms (cached ones if given) and the mapping is applied as a lookup table
+    if img.dtype != np.uint8:
+        # Wider input (e.g. 16-bit PNG) has more than 256 levels: stretch arithmetically
+        if len(img.shape) == 2:
+            lo, hi = np.percentile(img, (low_perc, high_perc))
+            return np.clip((img - lo) * (255.0/(hi - lo + 1e-6)), 0, 255).astype(np.uint8)
+        out = np.zeros(img.shape, np.uint8)
+        for c in range(img.shape[2]):
             lo, hi = np.percentile(img[:,:,c], (low_perc, high_perc))
-            chan = (img[:,:,c] - lo) * (255.0/(hi - lo + 1e-6))
-            out[:,:,c] = np.clip(chan, 0, 255)
-        return out.astype(np.uint8)
+            out[:,:,c] = np.clip((img[:,:,c] - lo) * (255.0/(hi - lo + 1e-6)), 0, 255)
+        return out
+    if hists is None:
+        hists = channel_histograms(img)
+    levels = np.arange(256, dtype=np.float64)
+    luts = []
+    for hist in hists:
+        lo, hi = percentile(hist, low_perc), percentile(hist, high_perc)
+        luts.append(np.clip((levels - lo) * (255.0/(hi - lo + 1e-6)), 0, 255).astype(np.uint8))
+    if len(img.shape) == 2:
+        return cv2.LUT(img, luts[0])
+    return cv2.LUT(img, np.stack(luts, axis=-1).reshape(1, 256, -1))
 
 def sharpen(img: np.ndarray, amount: float = 1.0) -> np.ndarray:
     # Unsharp masking
@@ -201,11 +210,17 @@ def split_screen_compare(left_img: np.ndarray, right_img: np.ndarray) -> np.ndar
     left = to_3channel(left_img)
     right = to_3channel(right_img)
     h, w = left.shape[:2]
-    out = left.copy()
-    out[:, w//2:] = right[:, w//2:]
-    return out
+    # One new buffer from the two halves instead of copying `left` and overwriting half of it
+    return np.concatenate([left[:, :w//2], right[:, w//2:]], axis=1)
 
 def encode_format(img_rgb: np.ndarray, ext: str = ".png") -> bytes:
     bgr = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
     ret, buf = cv2.imencode(ext, bgr)
     return buf.tobytes() if ret else None
+
+def jpeg_roundtrip(img: np.ndarray, quality: int = 90) -> np.ndarray:
+    """Encode and decode through JPEG to show the compression artefacts."""
+    ret, buf = cv2.imencode(".jpg", img if len(img.shape) == 2 else cv2.cvtColor(img, cv2.COLOR_RGB2BGR),
+                            [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+    out = cv2.imdecode(buf, cv2.IMREAD_UNCHANGED)
+    return out if len(out.shape) == 2 else cv2.cvtColor(out, cv2.COLOR_BGR2RGB)
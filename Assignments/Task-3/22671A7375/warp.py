@@ -0,0 +1,174 @@
+import cv2
+from collections import OrderedDict
+import numpy as np
+from typing import Optional, Tuple
+
+# ------------------------------
+# Homogeneous 3x3 matrices
+# ------------------------------
+# Each builder returns the forward map (source pixel -> destination pixel) of
+# the matching utils.py transform, so chaining is a plain matrix product.
+
+def rotation_matrix(angle: float, center: Tuple[float, float], scale: float = 1.0) -> np.ndarray:
+    return np.vstack([cv2.getRotationMatrix2D(center, angle, scale), [0, 0, 1]])
+
+def scale_matrix(fx: float, fy: float) -> np.ndarray:
+    # Same pixel-centre convention as cv2.resize: x' = fx * (x + 0.5) - 0.5
+    return np.array([[fx, 0, 0.5 * (fx - 1)], [0, fy, 0.5 * (fy - 1)], [0, 0, 1]], np.float64)
+
+def translation_matrix(tx: float, ty: float) -> np.ndarray:
+    return np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]], np.float64)
+
+def affine_matrix(src_pts: np.ndarray, dst_pts: np.ndarray) -> np.ndarray:
+    M = cv2.getAffineTransform(np.float32(src_pts), np.float32(dst_pts))
+    return np.vstack([M, [0, 0, 1]])
+
+def perspective_matrix(src_pts: np.ndarray, dst_pts: np.ndarray) -> np.ndarray:
+    return cv2.getPerspectiveTransform(np.float32(src_pts), np.float32(dst_pts)).astype(np.float64)
+
+def is_affine(M: np.ndarray) -> bool:
+    return np.allclose(M[2], [0, 0, 1])
+
+# ------------------------------
+# Canvas
+# ------------------------------
+def transformed_corners(M: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    w, h = size
+    corners = np.float64([[0, 0], [w - 1, 0], [0, h - 1], [w - 1, h - 1]]).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(corners, M).reshape(-1, 2)
+
+def fit_canvas(M: np.ndarray, size: Tuple[int, int]) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Shift M so the whole warped image lands on a canvas just big enough to hold it."""
+    pts = transformed_corners(M, size)
+    x0, y0 = np.floor(pts.min(axis=0))
+    x1, y1 = np.ceil(pts.max(axis=0))
+    return translation_matrix(-x0, -y0) @ M, (int(x1 - x0) + 1, int(y1 - y0) + 1)
+
+# ------------------------------
+# Chain
+# ------------------------------
+class WarpChain:
+    """Accumulates geometric steps and resamples the image once.
+
+    The canvas follows the same rules as the single-step functions in
+    utils.py: rotate/translate/affine/perspective keep the current size and
+    scale resizes it, so ``chain.apply(img)`` matches running the steps one
+    after another, minus the intermediate interpolations. Intermediate
+    canvases do not clip, so pixels a rotation pushed off-canvas can be
+    brought back by a later translate instead of turning black.
+    """
+
+    def __init__(self, size: Tuple[int, int]):
+        self.size = (int(size[0]), int(size[1]))
+        self.matrix = np.eye(3)
+
+    def then(self, M: np.ndarray, size: Optional[Tuple[int, int]] = None) -> "WarpChain":
+        self.matrix = np.asarray(M, np.float64) @ self.matrix
+        if size is not None:
+            self.size = (int(size[0]), int(size[1]))
+        return self
+
+    def rotate(self, angle: float, center: Optional[Tuple[float, float]] = None, scale: float = 1.0) -> "WarpChain":
+        w, h = self.size
+        if center is None:
+            center = (w // 2, h // 2)
+        return self.then(rotation_matrix(angle, center, scale))
+
+    def scale(self, fx: float, fy: float) -> "WarpChain":
+        w, h = self.size
+        return self.then(scale_matrix(fx, fy), (round(w * fx), round(h * fy)))
+
+    def translate(self, tx: float, ty: float) -> "WarpChain":
+        return self.then(translation_matrix(tx, ty))
+
+    def affine(self, src_pts: np.ndarray, dst_pts: np.ndarray) -> "WarpChain":
+        return self.then(affine_matrix(src_pts, dst_pts))
+
+    def perspective(self, src_pts: np.ndarray, dst_pts: np.ndarray) -> "WarpChain":
+        return self.then(perspective_matrix(src_pts, dst_pts))
+
+    def plan(self, src_size: Tuple[int, int], fit: bool = False) -> Tuple[np.ndarray, Tuple[int, int]]:
+        if fit:
+            return fit_canvas(self.matrix, src_size)
+        return self.matrix, self.size
+
+    def apply(self, img: np.ndarray, fit: bool = False, interpolation: int = cv2.INTER_LINEAR,
+              border_mode: int = cv2.BORDER_CONSTANT) -> np.ndarray:
+        h, w = img.shape[:2]
+        M, dsize = self.plan((w, h), fit)
+        return warp(img, M, dsize, interpolation, border_mode)
+
+
+def warp(img: np.ndarray, M: np.ndarray, dsize: Tuple[int, int], interpolation: int = cv2.INTER_LINEAR,
+         border_mode: int = cv2.BORDER_CONSTANT) -> np.ndarray:
+    if is_affine(M):
+        return cv2.warpAffine(img, M[:2], dsize, flags=interpolation, borderMode=border_mode)
+    return cv2.warpPerspective(img, M, dsize, flags=interpolation, borderMode=border_mode)
+
+# ------------------------------
+# Remap plans (video / repeated warps)
+# ------------------------------
+class RemapCache:
+    """LRU of fixed-point cv2.remap tables keyed by (matrix, input size, output size, interpolation).
+
+    warpAffine/warpPerspective rebuild the source coordinates of every output
+    pixel on each call. When the same transform hits every frame of a stream,
+    computing them once and converting to CV_16SC2 (integer coords plus
+    interpolation-table indices) leaves remap with only the gather and blend.
+    Nearest-neighbour warps skip the table: the gather through a map costs
+    more than OpenCV recomputing integer coordinates inline.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(M: np.ndarray, src_size: Tuple[int, int], dsize: Tuple[int, int], interpolation: int):
+        return (np.round(np.asarray(M, np.float64), 9).tobytes(), tuple(src_size), tuple(dsize), interpolation)
+
+    def plan(self, M: np.ndarray, src_size: Tuple[int, int], dsize: Tuple[int, int],
+             interpolation: int = cv2.INTER_LINEAR) -> Tuple[np.ndarray, np.ndarray]:
+        k = self.key(M, src_size, dsize, interpolation)
+        maps = self._plans.get(k)
+        if maps is not None:
+            self.hits += 1
+            self._plans.move_to_end(k)
+            return maps
+        self.misses += 1
+        maps = build_remap(M, dsize)
+        self._plans[k] = maps
+        if len(self._plans) > self.max_entries:
+            self._plans.popitem(last=False)
+        return maps
+
+    def warp(self, img: np.ndarray, M: np.ndarray, dsize: Optional[Tuple[int, int]] = None,
+             interpolation: int = cv2.INTER_LINEAR, border_mode: int = cv2.BORDER_CONSTANT) -> np.ndarray:
+        h, w = img.shape[:2]
+        dsize = (w, h) if dsize is None else dsize
+        if interpolation == cv2.INTER_NEAREST:
+            return warp(img, M, dsize, interpolation, border_mode)
+        map1, map2 = self.plan(M, (w, h), dsize, interpolation)
+        return cv2.remap(img, map1, map2, interpolation, borderMode=border_mode)
+
+    def clear(self):
+        self._plans.clear()
+
+
+def build_remap(M: np.ndarray, dsize: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    w, h = dsize
+    Minv = np.linalg.inv(np.asarray(M, np.float64))
+    xs = np.arange(w, dtype=np.float64)
+    ys = np.arange(h, dtype=np.float64)[:, None]
+    sx = Minv[0, 0] * xs + Minv[0, 1] * ys + Minv[0, 2]
+    sy = Minv[1, 0] * xs + Minv[1, 1] * ys + Minv[1, 2]
+    if not is_affine(M):
+        sw = Minv[2, 0] * xs + Minv[2, 1] * ys + Minv[2, 2]
+        sw = np.where(sw != 0, 1.0 / sw, 0.0)
+        sx, sy = sx * sw, sy * sw
+    return cv2.convertMaps(sx.astype(np.float32), sy.astype(np.float32), cv2.CV_16SC2)
+
+
+remap_cache = RemapCache()